@@ -1,34 +1,36 @@
 import os
 import time
 import logging
-import uuid
+import hashlib
 import re
-import warnings
-from sqlalchemy.exc import SAWarning
-warnings.filterwarnings('ignore', category=SAWarning)
-
-import datetime
 import stripe
 import traceback
 from flask import (
     Flask, request, jsonify, render_template, make_response,
-    redirect, session, url_for, g, flash, get_flashed_messages
+    redirect, session, url_for, g, flash, get_flashed_messages, abort
 )
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from functools import wraps
-from sqlalchemy.orm import joinedload
+from collections import deque
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+from sqlalchemy.orm import joinedload, selectinload, load_only
 from urllib.parse import urlencode
+import httpx
 from openai import OpenAI
 from dotenv import load_dotenv
 import pdfkit
 import random
 import json
+from json_repair import repair_json
 from chatbot_utils import get_chatbot_response
 from flask_migrate import Migrate
-from sqlalchemy import text
-from sqlalchemy.exc import OperationalError
-from datetime import datetime  # Pour le timestamp
+from sqlalchemy import text, insert, select, literal
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.pool import QueuePool
+from datetime import datetime, timedelta, timezone
 
 # 🧠 Modèles et config
 from models import (
@@ -45,44 +47,81 @@ load_dotenv()
 # --- Clé secrète ---
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key-change-me')
 
+# ⚡ Compression des réponses (Brotli, repli gzip) : les pages pédagogiques
+# bilingues + LaTeX et les JSON des menus en cascade se compressent 3-5×,
+# un gain net sur les réseaux scolaires à faible débit.
+from flask_compress import Compress
+
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+app.config["COMPRESS_MIN_SIZE"] = 500
+Compress(app)
+
+# ⚡ Sérialisation JSON via orjson (natif) : jsonify devient 5-10x plus
+# rapide sur les grosses réponses (listes d'exercices, analyses IA) et
+# les datetime sont gérés nativement.
+import orjson
+from flask.json.provider import JSONProvider
+
+class OrjsonProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NAIVE_UTC).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = OrjsonProvider(app)
+
+# Configuration du logging : les messages de démarrage passent par logging
+# (flush unique, niveau pilotable via LOG_LEVEL) plutôt que par print
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+logger = logging.getLogger(__name__)
+
 # ====================================================================
 # 🔧 CONFIGURATION INTELLIGENTE DE LA BASE DE DONNÉES
 # ====================================================================
 
+from functools import lru_cache
+
+@lru_cache(maxsize=1)
 def get_database_url():
     """
     Détermine l'URL de la base de données selon l'environnement.
-    Priorité : 
+    Calculée une seule fois (lru_cache) : les lectures d'environnement et
+    les print ne sont pas refaits si la fonction est rappelée.
+    Priorité :
     1. PostgreSQL sur Render (RENDER_POSTGRES_URL)
-    2. PostgreSQL standard (DATABASE_URL) 
+    2. PostgreSQL standard (DATABASE_URL)
     3. PostgreSQL externe (POSTGRES_URL)
     4. SQLite local (développement)
     """
     # 1. PostgreSQL intégré Render (service web + base)
     render_postgres_url = os.getenv('RENDER_POSTGRES_URL')
     if render_postgres_url:
-        print("🎯 Configuration: PostgreSQL Render (RENDER_POSTGRES_URL)")
+        logger.info("🎯 Configuration: PostgreSQL Render (RENDER_POSTGRES_URL)")
         db_url = render_postgres_url
     
     # 2. Base de données Render dédiée
     elif os.getenv('DATABASE_URL'):
-        print("🎯 Configuration: Base de données Render dédiée (DATABASE_URL)")
+        logger.info("🎯 Configuration: Base de données Render dédiée (DATABASE_URL)")
         db_url = os.getenv('DATABASE_URL')
     
     # 3. PostgreSQL externe
     elif os.getenv('POSTGRES_URL'):
-        print("🎯 Configuration: PostgreSQL externe (POSTGRES_URL)")
+        logger.info("🎯 Configuration: PostgreSQL externe (POSTGRES_URL)")
         db_url = os.getenv('POSTGRES_URL')
     
     # 4. Développement local - SQLite
     else:
-        print("💻 Configuration: SQLite local (développement)")
+        logger.info("💻 Configuration: SQLite local (développement)")
         db_url = 'sqlite:///tutorat_ai.db'
     
     # Correction pour SQLAlchemy 2.0+ (postgres:// → postgresql://)
     if isinstance(db_url, str) and db_url.startswith("postgres://"):
         db_url = db_url.replace("postgres://", "postgresql://", 1)
-        print("🔧 Correction: postgres:// → postgresql://")
+        logger.info("🔧 Correction: postgres:// → postgresql://")
     
     return db_url
 
@@ -91,52 +130,358 @@ DB_URL = get_database_url()
 app.config['SQLALCHEMY_DATABASE_URI'] = DB_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Précalculé une fois : évite de rescanner l'URL à chaque test de dialecte
+IS_POSTGRES = DB_URL.startswith('postgresql')
+
 # Options avancées pour PostgreSQL
-if 'postgresql' in DB_URL:
+if IS_POSTGRES:
     app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        # Pool persistant explicite : jamais de NullPool, le coût TCP + TLS +
+        # auth d'une connexion Postgres est amorti sur toutes les requêtes
+        "poolclass": QueuePool,
         "pool_pre_ping": True,          # Vérifie la connexion avant utilisation
-        "pool_recycle": 280,            # Recycle les connexions après 280s
-        "pool_size": 5,                 # Nombre de connexions permanentes
-        "max_overflow": 10,             # Connexions supplémentaires temporaires
+        "pool_recycle": 3600,           # Recycle les connexions après 1h
+        # Taille du pool ajustable via env : chaque requête garde sa connexion
+        # pendant les appels OpenAI, un pool trop petit devient le goulot
+        "pool_size": int(os.getenv("SQLALCHEMY_POOL_SIZE", 20)),
+        "max_overflow": int(os.getenv("SQLALCHEMY_MAX_OVERFLOW", 30)),
+        "pool_timeout": 10,             # Attente max d'une connexion libre
+        "query_cache_size": 1200,       # Cache des requêtes SQL compilées
         "connect_args": {
             "connect_timeout": 10,      # Timeout de connexion de 10s
             "keepalives": 1,            # Keepalive TCP
-            "keepalives_idle": 30,      # Attente avant keepalive
+            "keepalives_idle": 20,      # Attente avant keepalive
             "keepalives_interval": 10,  # Intervalle entre keepalives
         }
     }
-    print(f"⚙️ Options PostgreSQL activées")
+    logger.info("⚙️ Options PostgreSQL activées")
 else:
     # SQLite - options minimales
     app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
         "pool_pre_ping": False,
         "pool_recycle": -1,
+        "query_cache_size": 1200,       # Cache des requêtes SQL compilées
     }
-    print(f"⚙️ Options SQLite (développement)")
-
-# Log de l'URL (masquée pour sécurité)
-if DB_URL and len(DB_URL) > 20:
-    masked_url = DB_URL[:20] + "..." + DB_URL[-20:] if len(DB_URL) > 40 else DB_URL[:40] + "..."
-    print(f"🔗 URL Base de données: {masked_url}")
+    logger.info("⚙️ Options SQLite (développement)")
+
+# Log de l'URL (masquée pour sécurité) : calculée une fois via urlparse,
+# sans jamais inclure les identifiants ni la fin de l'URL (user:pass@host)
+from urllib.parse import urlparse as _urlparse
+_u = _urlparse(DB_URL)
+MASKED_DB_URL = "{}://{}{}/{}".format(
+    _u.scheme,
+    _u.hostname or "",
+    ":%s" % _u.port if _u.port else "",
+    (_u.path or "").lstrip("/"),
+)
+logger.info("🔗 URL Base de données: %s", MASKED_DB_URL)
 
 # ====================================================================
 # FIN CONFIGURATION BASE DE DONNÉES
 # ====================================================================
 
-# Configuration du logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
 # 🔌 Initialisation des extensions
 db.init_app(app)
 migrate = Migrate(app, db)
 
+# 🔍 Audit des requêtes N+1 en développement (pip install nplusone) :
+# journalise chaque chargement paresseux déclenché dans une boucle,
+# pour repérer les joinedload/selectinload manquants. Jamais en prod.
+if os.getenv("FLASK_DEBUG") or os.getenv("NPLUSONE_AUDIT"):
+    try:
+        from nplusone.ext.flask_sqlalchemy import NPlusOne
+        app.config["NPLUSONE_LOGGER"] = logging.getLogger("nplusone")
+        app.config["NPLUSONE_LOG_LEVEL"] = logging.WARN
+        NPlusOne(app)
+        logger.info("🔍 nplusone actif (audit des requêtes N+1)")
+    except ImportError:
+        logger.info("🔍 nplusone non installé — audit N+1 désactivé")
+
+# ⚡ PRAGMA de performance pour SQLite (développement) : le mode WAL évite
+# un fsync par commit et synchronous=NORMAL relâche l'attente disque —
+# les suites de tests locales en profitent le plus. Sans effet sur Postgres.
+if not IS_POSTGRES:
+    from sqlalchemy import event as _event_sqlite
+    from sqlalchemy.engine import Engine as _Engine
+
+    @_event_sqlite.listens_for(_Engine, "connect")
+    def _regler_pragmas_sqlite(dbapi_connection, connection_record):
+        curseur = dbapi_connection.cursor()
+        curseur.execute("PRAGMA foreign_keys=ON")
+        curseur.execute("PRAGMA journal_mode=WAL")
+        curseur.execute("PRAGMA synchronous=NORMAL")
+        curseur.execute("PRAGMA temp_store=MEMORY")
+        curseur.execute("PRAGMA cache_size=-65536")
+        curseur.close()
+
+# 🗄️ Cache applicatif pour les tables de référence (Niveau, Matiere, Unite, Lecon)
+# Redis en production (REDIS_URL), cache mémoire simple en développement
+from flask_caching import Cache
+
+if os.getenv("REDIS_URL"):
+    cache = Cache(app, config={
+        "CACHE_TYPE": "RedisCache",
+        "CACHE_REDIS_URL": os.getenv("REDIS_URL"),
+        "CACHE_DEFAULT_TIMEOUT": 300,
+    })
+    logger.info("🗄️ Cache: Redis")
+else:
+    cache = Cache(app, config={
+        "CACHE_TYPE": "SimpleCache",
+        "CACHE_DEFAULT_TIMEOUT": 300,
+    })
+    logger.warning(
+        "🗄️ Cache: mémoire locale (SimpleCache) — l'état des tâches de fond "
+        "n'est pas partagé entre processus ; gunicorn.conf.py force alors un "
+        "seul worker. Définir REDIS_URL en production multi-workers."
+    )
+
+# 🗄️ Sessions côté serveur quand Redis est disponible : le cookie ne porte
+# plus qu'un identifiant. L'historique de conversation voyageait sinon en
+# entier dans le cookie signé à chaque requête (limite ~4 Ko de Werkzeug
+# vite atteinte avec 15 tours de dialogue).
+if os.getenv("REDIS_URL"):
+    import redis
+    from flask_session import Session
+
+    app.config["SESSION_TYPE"] = "redis"
+    app.config["SESSION_REDIS"] = redis.from_url(
+        os.getenv("REDIS_URL"), socket_keepalive=True
+    )
+    app.config["SESSION_PERMANENT"] = False
+    app.config["SESSION_USE_SIGNER"] = True
+    Session(app)
+    logger.info("🗄️ Sessions: Redis (cookie = identifiant seul)")
+
+
+# ⚡ Les helpers de référence passent par select() en tuples légers : pour des
+# listes destinées à jsonify/au rendu, construire des instances ORM complètes
+# ne sert à rien et coûte 3-5× plus cher que les lignes brutes.
+@cache.memoize(timeout=3600)
+def get_tous_niveaux():
+    """Liste (id, nom, nom_en) des niveaux — mise en cache car quasi statique."""
+    return [
+        {"id": id_, "nom": nom, "nom_en": nom_en}
+        for id_, nom, nom_en in db.session.execute(
+            select(Niveau.id, Niveau.nom, Niveau.nom_en)
+        )
+    ]
+
+
+@cache.memoize(timeout=3600)
+def get_matieres_par_niveau(niveau_id, lang="fr"):
+    """Liste (id, nom) des matières d'un niveau — mise en cache car quasi statique."""
+    lignes = db.session.execute(
+        select(Matiere.id, Matiere.nom, Matiere.nom_en)
+        .where(Matiere.niveau_id == niveau_id)
+    )
+    return [
+        {"id": id_, "nom": nom_en if lang == "en" and nom_en else nom}
+        for id_, nom, nom_en in lignes
+    ]
+
+
+@cache.memoize(timeout=3600)
+def get_unites_par_matiere(matiere_id, lang="fr"):
+    """Liste (id, nom) des unités d'une matière — mise en cache car quasi statique."""
+    lignes = db.session.execute(
+        select(Unite.id, Unite.nom, Unite.nom_en)
+        .where(Unite.matiere_id == matiere_id)
+    )
+    return [
+        {"id": id_, "nom": nom_en if lang == "en" and nom_en else nom}
+        for id_, nom, nom_en in lignes
+    ]
+
+
+@cache.memoize(timeout=3600)
+def get_lecons_par_unite(unite_id, lang="fr"):
+    """Liste (id, titre) des leçons d'une unité — mise en cache car quasi statique."""
+    lignes = db.session.execute(
+        select(Lecon.id, Lecon.titre_fr, Lecon.titre_en)
+        .where(Lecon.unite_id == unite_id)
+    )
+    return [
+        {"id": id_, "titre": titre_en if lang == "en" and titre_en else titre_fr}
+        for id_, titre_fr, titre_en in lignes
+    ]
+
+
+@cache.memoize(timeout=3600)
+def get_exercice_cached(ex_id):
+    """Exercice + chaîne leçon→unité→matière→niveau depuis le cache ; None si inexistant.
+
+    🗄️ L'instance est mise en cache détachée : toute la chaîne est chargée
+    d'avance pour que les propriétés ``theme``/``niveau`` (qui la traversent)
+    restent lisibles sans session. Réattacher via
+    ``db.session.merge(..., load=False)`` avant tout autre accès paresseux.
+    """
+    return Exercice.query.options(
+        joinedload(Exercice.lecon)
+        .joinedload(Lecon.unite)
+        .joinedload(Unite.matiere)
+        .joinedload(Matiere.niveau)
+    ).get(ex_id)
+
+
+@cache.memoize(timeout=300)
+def get_arbre_contenu():
+    """Arbre complet Niveau→Matière→Unité→(Leçons, Tests)→Exercices.
+
+    🗄️ Lu à chaque affichage du tableau de bord admin mais modifié rarement :
+    tout est chargé d'avance (tests d'unité compris) pour que les instances
+    détachées du cache restent lisibles sans session.
+    """
+    return Niveau.query.options(
+        joinedload(Niveau.matieres)
+        .joinedload(Matiere.unites)
+        .joinedload(Unite.lecons)
+        .joinedload(Lecon.exercices),
+        joinedload(Niveau.matieres)
+        .joinedload(Matiere.unites)
+        .joinedload(Unite.tests),
+    ).all()
+
+
+def _invalider_cache_reference(mapper, connection, target):
+    """Vide le cache des tables de référence dès qu'un contenu est modifié."""
+    cache.delete_memoized(get_tous_niveaux)
+    cache.delete_memoized(get_matieres_par_niveau)
+    cache.delete_memoized(get_unites_par_matiere)
+    cache.delete_memoized(get_lecons_par_unite)
+    cache.delete_memoized(get_arbre_contenu)
+
+
+@cache.memoize(timeout=300)
+def get_liste_enseignants():
+    """Liste (id, nom, email) des enseignants — mise en cache car la table ne
+    change que par les routes admin (inscription, modification, suppression)."""
+    lignes = db.session.execute(
+        select(Enseignant.id, Enseignant.nom, Enseignant.email)
+    )
+    return [
+        {"id": id_, "nom": nom, "email": email}
+        for id_, nom, email in lignes
+    ]
+
+
+def _invalider_cache_exercice(mapper, connection, target):
+    """Invalide l'exercice mis en cache et l'arbre admin à chaque écriture."""
+    cache.delete_memoized(get_exercice_cached, target.id)
+    cache.delete_memoized(get_arbre_contenu)
+
+
+def _invalider_cache_enseignants(mapper, connection, target):
+    """Vide la liste des enseignants en cache à chaque écriture sur la table."""
+    cache.delete_memoized(get_liste_enseignants)
+
+
+from sqlalchemy import event
+for _modele in (Niveau, Matiere, Unite, Lecon, TestSommatif):
+    for _evenement in ("after_insert", "after_update", "after_delete"):
+        event.listen(_modele, _evenement, _invalider_cache_reference)
+for _evenement in ("after_insert", "after_update", "after_delete"):
+    event.listen(Exercice, _evenement, _invalider_cache_exercice)
+    event.listen(Enseignant, _evenement, _invalider_cache_enseignants)
+
 # ✅ CONFIGURATION STRIPE CORRECTE - CLÉ VALIDE
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY", "")
+if not stripe.api_key:
+    logger.warning("⚠️ STRIPE_SECRET_KEY absente : les paiements échoueront")
 
 # Debug Stripe
-print(f"🎯 Stripe configuré: {bool(stripe.api_key)}")
-print(f"🔑 Clé utilisée: {stripe.api_key[:20]}..." if stripe.api_key else "❌ Pas de clé Stripe")
+logger.info("🎯 Stripe configuré: %s", bool(stripe.api_key))
+logger.info("🔑 Clé utilisée: %s..." % stripe.api_key[:20] if stripe.api_key else "❌ Pas de clé Stripe")
+
+# 💳 Tarification des forfaits : une seule constante de module en lecture
+# seule (MappingProxyType) au lieu du même dictionnaire reconstruit dans
+# chaque route de paiement — et un seul endroit à modifier au prochain tarif
+PLAN_CONFIG = MappingProxyType({
+    'weekly': MappingProxyType({
+        'amount': 1500,  # 15.00 CAD
+        'description_fr': "Forfait hebdomadaire - Tutorat intelligent avec enseignant virtuel IA",
+        'description_en': "Weekly plan - Intelligent tutoring with AI virtual teacher",
+        'product_name_fr': "Forfait Hebdomadaire (15$/semaine)",
+        'product_name_en': "Weekly Plan (15$/week)",
+        'interval': 'week'
+    }),
+    'monthly': MappingProxyType({
+        'amount': 5000,  # 50.00 CAD
+        'description_fr': "Forfait mensuel - Tutorat intelligent avec enseignant virtuel IA",
+        'description_en': "Monthly plan - Intelligent tutoring with AI virtual teacher",
+        'product_name_fr': "Forfait Mensuel (50$/mois)",
+        'product_name_en': "Monthly Plan (50$/month)",
+        'interval': 'month'
+    }),
+    'annual': MappingProxyType({
+        'amount': 45000,  # 450.00 CAD
+        'description_fr': "Forfait annuel - Tutorat intelligent avec enseignant virtuel IA - Économisez 25%",
+        'description_en': "Annual plan - Intelligent tutoring with AI virtual teacher - Save 25%",
+        'product_name_fr': "Forfait Annuel (450$/an) - Meilleur rapport",
+        'product_name_en': "Annual Plan (450$/year) - Best value",
+        'interval': 'year'
+    }),
+})
+
+
+# 💳 Identifiants de Prix Stripe pré-créés (dashboard ou CLI), fournis par
+# variables d'environnement : avec un price réutilisé, Stripe ne recrée pas un
+# produit ad hoc à chaque paiement et la charge utile sortante est bien plus
+# petite. Repli sur price_data construit depuis PLAN_CONFIG sinon.
+STRIPE_PRICE_IDS = {
+    plan: os.getenv(f"STRIPE_PRICE_ID_{plan.upper()}")
+    for plan in ("weekly", "monthly", "annual")
+}
+
+
+def _creer_session_checkout(eleve_id, email, plan_type, lang, cancel_url):
+    """Crée la session Stripe Checkout d'un abonnement (logique partagée)."""
+    plan_info = PLAN_CONFIG.get(plan_type, PLAN_CONFIG['annual'])
+    suffixe = 'en' if lang == 'en' else 'fr'
+
+    price_id = STRIPE_PRICE_IDS.get(plan_type)
+    if price_id:
+        ligne = {'price': price_id, 'quantity': 1}
+    else:
+        ligne = {
+            'price_data': {
+                'currency': 'cad',
+                'product_data': {
+                    'name': plan_info[f'product_name_{suffixe}'],
+                    'description': plan_info[f'description_{suffixe}'],
+                    'metadata': {'plan_type': plan_type, 'lang': lang}
+                },
+                'unit_amount': plan_info['amount'],
+                'recurring': {'interval': plan_info['interval'], 'interval_count': 1}
+            },
+            'quantity': 1,
+        }
+
+    return stripe.checkout.Session.create(
+        payment_method_types=['card'],
+        line_items=[ligne],
+        mode='subscription',
+        subscription_data={
+            'metadata': {
+                'eleve_id': eleve_id,
+                'plan_type': plan_type,
+                'lang': lang
+            }
+        },
+        success_url=url_for('paiement_success', _external=True)
+        + f'?session_id={{CHECKOUT_SESSION_ID}}&eleve_id={eleve_id}&plan_type={plan_type}',
+        cancel_url=cancel_url,
+        customer_email=email,
+        metadata={
+            'eleve_id': eleve_id,
+            'plan_type': plan_type,
+            'lang': lang,
+            'type': f'abonnement_{plan_type}'
+        },
+        allow_promotion_codes=True,
+        billing_address_collection='required',
+        phone_number_collection={'enabled': True}
+    )
 
 # 📁 Configuration des uploads
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
@@ -145,36 +490,87 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10 Mo par requête
 
-# 🔌 Initialisation OpenAI
-client = OpenAI(api_key=OPENAI_API_KEY)
+# 🔌 Initialisation OpenAI — paresseuse : le client httpx (pool de
+# connexions, contexte TLS, verrous) n'est construit que dans les workers
+# qui appellent réellement l'API, au premier usage.
+@lru_cache(maxsize=1)
+def get_openai_client():
+    # 🔌 Transport httpx partagé et réglé : les connexions keep-alive sont
+    # réutilisées entre les threads gthread (le handshake TLS n'est payé
+    # qu'à froid) et HTTP/2 multiplexe les appels concurrents — dont le
+    # fan-out de génération — sur une même connexion.
+    return OpenAI(
+        api_key=OPENAI_API_KEY,
+        http_client=httpx.Client(
+            http2=True,
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            # keepalive_expiry allongé : les connexions TLS survivent aux
+            # creux de trafic entre deux corrections au lieu d'expirer en 5 s
+            limits=httpx.Limits(
+                max_keepalive_connections=20,
+                max_connections=100,
+                keepalive_expiry=60.0,
+            ),
+        ),
+    )
+
+
+# ⚡ Routage par tâche : le dialogue pédagogique (reformuler, poser la
+# question suivante) n'a pas besoin de la pleine capacité de gpt-4 — un
+# modèle « mini » répond nettement plus vite et moins cher. On réserve le
+# modèle de génération aux exercices JSON, où le respect du schéma compte.
+MODEL_CHAT = os.getenv("MODEL_CHAT", "gpt-4o-mini")
+MODEL_GEN = os.getenv("MODEL_GEN", "gpt-4o")
+# Notation et descriptions : tâche déterministe à sortie structurée, le
+# modèle économique suffit ; repli sur MODEL_CHAT si la note est illisible.
+MODEL_NOTATION = os.getenv("MODEL_NOTATION", "gpt-3.5-turbo")
 
-# --- Optimisations pour PostgreSQL ---
-@app.before_request
-def _enable_foreign_keys():
-    """Active les clés étrangères pour SQLite (ignoré par PostgreSQL)"""
-    if hasattr(db, 'engine') and 'sqlite' in str(db.engine.url):
-        db.session.execute(text('PRAGMA foreign_keys=ON'))
+
+class _ClientOpenAIParesseux:
+    """Proxy minimal : garde le nom historique `client` utilisé partout
+    dans le module sans construire le vrai client à l'import."""
+
+    def __getattr__(self, attribut):
+        return getattr(get_openai_client(), attribut)
+
+
+client = _ClientOpenAIParesseux()
+
+# NB : PRAGMA foreign_keys=ON est appliqué une fois par connexion SQLite
+# via le listener "connect" plus haut — plus de hook par requête.
 
 @app.before_request
 def log_start_time():
-    request.start_time = time.time()
+    # perf_counter : horloge monotone (vDSO), insensible aux sauts d'horloge
+    # et moins chère que time.time() ; stockée dans environ plutôt qu'en
+    # attribut sur l'objet request (proxy Werkzeug)
+    request.environ['_t0'] = time.perf_counter()
 
 @app.after_request
 def log_end_time(response):
-    if hasattr(request, 'start_time'):
-        duration = time.time() - request.start_time
+    t0 = request.environ.get('_t0')
+    if t0 is not None:
+        duration = time.perf_counter() - t0
         if duration > 0.5:  # Seuil d'alerte à 500ms
-            logger.warning(f"Requête longue: {request.path} a pris {duration:.2f}s")
+            logger.warning("Requête longue: %s a pris %.2fs", request.path, duration)
     return response
 
 def execute_with_retry(func, max_retries=3):
-    """Exécute une fonction avec des retries en cas d'erreur de concurrence SQLite."""
+    """Exécute une fonction avec des retries en cas d'erreur de concurrence SQLite.
+
+    Sur PostgreSQL « database is locked » n'existe pas : appel direct, sans
+    même le coût du bloc try/except. Sur SQLite, backoff exponentiel avec
+    gigue pour éviter que des requêtes concurrentes ne retentent toutes au
+    même instant sur le verrou d'écriture.
+    """
+    if IS_POSTGRES:
+        return func()
     for attempt in range(max_retries):
         try:
             return func()
         except OperationalError as e:
             if "locked" in str(e) and attempt < max_retries - 1:
-                time.sleep(0.1 * (attempt + 1))
+                time.sleep((0.05 * (2 ** attempt)) + random.uniform(0, 0.05))
                 continue
             raise
 
@@ -187,6 +583,123 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def get_eleve_courant():
+    """Retourne l'élève connecté, résolu une seule fois par requête (via flask.g).
+
+    Le hook before_request et le handler re-demandaient chacun le même User ;
+    g meurt à la fin de la requête donc aucune invalidation n'est nécessaire.
+    """
+    if "eleve_id" not in session:
+        return None
+    if "eleve_courant" not in g:
+        g.eleve_courant = User.query.options(
+            joinedload(User.niveau)
+        ).get(session["eleve_id"])
+    return g.eleve_courant
+
+
+# ⚡ Recherches d'authentification en lambda_stmt : le statement est construit
+# et mis en cache une fois pour toutes, chaque appel saute le calcul de la
+# clé de cache SQL (≈30% du coût d'une requête répétée).
+from sqlalchemy import select, bindparam, lambda_stmt
+
+def chercher_eleve_par_email(email):
+    stmt = lambda_stmt(lambda: select(User).where(
+        User.email == bindparam("email"), User.role == "élève"
+    ))
+    return db.session.execute(stmt, {"email": email}).scalars().first()
+
+def chercher_enseignant_par_email(email):
+    stmt = lambda_stmt(lambda: select(Enseignant).where(
+        Enseignant.email == bindparam("email")
+    ))
+    return db.session.execute(stmt, {"email": email}).scalars().first()
+
+def chercher_parent_par_email(email):
+    stmt = lambda_stmt(lambda: select(Parent).where(
+        Parent.email == bindparam("email")
+    ))
+    return db.session.execute(stmt, {"email": email}).scalars().first()
+
+from markupsafe import Markup
+
+# 🔎 Patrons LaTeX précompilés une seule fois au chargement du module :
+# le filtre tourne pour chaque variable de template, recompiler une
+# dizaine de patrons à chaque rendu est du travail perdu.
+_LATEX_SUBS = [
+    # Fractions: \frac{a}{b} → a/b
+    (re.compile(r'\\frac{([^}]+)}{([^}]+)}'), r'\1/\2'),
+    # Racines carrées: \sqrt{x} → √x, \sqrt[n]{x} → ⁿ√x
+    (re.compile(r'\\sqrt\[([^]]+)\]{(.+?)}'), r'\1√\2'),
+    (re.compile(r'\\sqrt{(.+?)}'), r'√\1'),
+]
+
+# Exposants / indices : une seule passe paramétrée par table Unicode au lieu
+# de trois substitutions successives par opérateur. Couvre tous les chiffres
+# (x^{4} → x⁴), avec repli sur x^exp / x_ind si un caractère n'a pas
+# d'équivalent Unicode.
+_EXPOSANTS = {'0': '⁰', '1': '¹', '2': '²', '3': '³', '4': '⁴',
+              '5': '⁵', '6': '⁶', '7': '⁷', '8': '⁸', '9': '⁹', 'n': 'ⁿ'}
+_INDICES = {'0': '₀', '1': '₁', '2': '₂', '3': '₃', '4': '₄',
+            '5': '₅', '6': '₆', '7': '₇', '8': '₈', '9': '₉', 'n': 'ₙ'}
+_PUISSANCE_RE = re.compile(r'(\w+)\^{(\w+)}')
+_INDICE_RE = re.compile(r'(\w+)_{(\w+)}')
+
+
+def _convertir_puissance(match):
+    base, exp = match.group(1), match.group(2)
+    if all(c in _EXPOSANTS for c in exp):
+        return base + ''.join(_EXPOSANTS[c] for c in exp)
+    return f"{base}^{exp}"
+
+
+def _convertir_indice(match):
+    base, ind = match.group(1), match.group(2)
+    if all(c in _INDICES for c in ind):
+        return base + ''.join(_INDICES[c] for c in ind)
+    return f"{base}_{ind}"
+
+# Équations en display / inline et normalisation des espaces
+_DISPLAY_MATH_RE = re.compile(r'\$\$(.*?)\$\$', re.DOTALL)
+_INLINE_MATH_RE = re.compile(r'\$(.*?)\$')
+
+# Table unique symboles LaTeX → Unicode (grec, opérateurs, ensembles, accents).
+# Une seule passe regex remplace ~60 text.replace() séquentiels, chacun
+# rescannant toute la chaîne.
+_SYMBOLES_LATEX = {
+    # Symboles grecs étendus
+    '\\alpha': 'α', '\\beta': 'β', '\\gamma': 'γ', '\\delta': 'δ',
+    '\\epsilon': 'ε', '\\zeta': 'ζ', '\\eta': 'η', '\\theta': 'θ',
+    '\\iota': 'ι', '\\kappa': 'κ', '\\lambda': 'λ', '\\mu': 'μ',
+    '\\nu': 'ν', '\\xi': 'ξ', '\\pi': 'π', '\\rho': 'ρ',
+    '\\sigma': 'σ', '\\tau': 'τ', '\\upsilon': 'υ', '\\phi': 'φ',
+    '\\chi': 'χ', '\\psi': 'ψ', '\\omega': 'ω',
+    '\\Gamma': 'Γ', '\\Delta': 'Δ', '\\Theta': 'Θ', '\\Lambda': 'Λ',
+    '\\Xi': 'Ξ', '\\Pi': 'Π', '\\Sigma': 'Σ', '\\Phi': 'Φ',
+    '\\Psi': 'Ψ', '\\Omega': 'Ω',
+    # Opérateurs mathématiques
+    '\\times': '×', '\\cdot': '·', '\\div': '÷', '\\pm': '±',
+    '\\mp': '∓', '\\leq': '≤', '\\geq': '≥', '\\neq': '≠',
+    '\\approx': '≈', '\\equiv': '≡', '\\propto': '∝', '\\infty': '∞',
+    '\\partial': '∂', '\\nabla': '∇', '\\forall': '∀', '\\exists': '∃',
+    '\\in': '∈', '\\notin': '∉', '\\subset': '⊂', '\\subseteq': '⊆',
+    '\\cup': '∪', '\\cap': '∩', '\\wedge': '∧', '\\vee': '∨',
+    '\\neg': '¬', '\\Rightarrow': '⇒', '\\Leftrightarrow': '⇔',
+    '\\rightarrow': '→', '\\leftarrow': '←',
+    # Ensembles
+    '\\mathbb{R}': 'ℝ', '\\mathbb{N}': 'ℕ', '\\mathbb{Z}': 'ℤ',
+    '\\mathbb{Q}': 'ℚ', '\\mathbb{C}': 'ℂ',
+    # Accents et symboles divers
+    '\\hat': '̂', '\\bar': '̄', '\\vec': '⃗', '\\dot': '̇',
+}
+
+# Alternation triée du plus long au plus court : \\subseteq doit matcher
+# avant \\subset, \\leq avant \\le, etc.
+_SYMBOLES_RE = re.compile('|'.join(
+    re.escape(s) for s in sorted(_SYMBOLES_LATEX, key=len, reverse=True)
+))
+
+
 @app.template_filter('replace_latex')
 def replace_latex_filter(text):
     """
@@ -194,85 +707,37 @@ def replace_latex_filter(text):
     """
     if not text:
         return text
-    
-    import re
-    
+
     # Nettoyage initial
     text = str(text)
-    
-    # Échappement HTML pour sécurité
-    from markupsafe import Markup
-    
-    # Fractions: \frac{a}{b} → a/b
-    text = re.sub(r'\\frac{([^}]+)}{([^}]+)}', r'\1/\2', text)
-    
-    # Racines carrées: \sqrt{x} → √x, \sqrt[n]{x} → ⁿ√x
-    text = re.sub(r'\\sqrt\[([^]]+)\]{(.+?)}', r'\1√\2', text)
-    text = re.sub(r'\\sqrt{(.+?)}', r'√\1', text)
-    
-    # Exposants: x^{2} → x², x^{n} → xⁿ
-    text = re.sub(r'(\w+)\^{2}', r'\1²', text)
-    text = re.sub(r'(\w+)\^{3}', r'\1³', text)
-    text = re.sub(r'(\w+)\^{(\w+)}', r'\1^\2', text)
-    
-    # Indices: x_{2} → x₂, x_{n} → xₙ
-    text = re.sub(r'(\w+)_{2}', r'\1₂', text)
-    text = re.sub(r'(\w+)_{3}', r'\1₃', text)
-    text = re.sub(r'(\w+)_{(\w+)}', r'\1_\2', text)
-    
-    # Symboles grecs étendus
-    greek_symbols = {
-        '\\alpha': 'α', '\\beta': 'β', '\\gamma': 'γ', '\\delta': 'δ',
-        '\\epsilon': 'ε', '\\zeta': 'ζ', '\\eta': 'η', '\\theta': 'θ',
-        '\\iota': 'ι', '\\kappa': 'κ', '\\lambda': 'λ', '\\mu': 'μ',
-        '\\nu': 'ν', '\\xi': 'ξ', '\\pi': 'π', '\\rho': 'ρ',
-        '\\sigma': 'σ', '\\tau': 'τ', '\\upsilon': 'υ', '\\phi': 'φ',
-        '\\chi': 'χ', '\\psi': 'ψ', '\\omega': 'ω',
-        '\\Gamma': 'Γ', '\\Delta': 'Δ', '\\Theta': 'Θ', '\\Lambda': 'Λ',
-        '\\Xi': 'Ξ', '\\Pi': 'Π', '\\Sigma': 'Σ', '\\Phi': 'Φ',
-        '\\Psi': 'Ψ', '\\Omega': 'Ω'
-    }
-    
-    for latex, symbol in greek_symbols.items():
-        text = text.replace(latex, symbol)
-    
-    # Opérateurs mathématiques
-    operators = {
-        '\\times': '×', '\\cdot': '·', '\\div': '÷', '\\pm': '±',
-        '\\mp': '∓', '\\leq': '≤', '\\geq': '≥', '\\neq': '≠',
-        '\\approx': '≈', '\\equiv': '≡', '\\propto': '∝', '\\infty': '∞',
-        '\\partial': '∂', '\\nabla': '∇', '\\forall': '∀', '\\exists': '∃',
-        '\\in': '∈', '\\notin': '∉', '\\subset': '⊂', '\\subseteq': '⊆',
-        '\\cup': '∪', '\\cap': '∩', '\\wedge': '∧', '\\vee': '∨',
-        '\\neg': '¬', '\\Rightarrow': '⇒', '\\Leftrightarrow': '⇔',
-        '\\rightarrow': '→', '\\leftarrow': '←'
-    }
-    
-    for latex, symbol in operators.items():
-        text = text.replace(latex, symbol)
-    
-    # Ensembles
-    text = text.replace('\\mathbb{R}', 'ℝ')
-    text = text.replace('\\mathbb{N}', 'ℕ')
-    text = text.replace('\\mathbb{Z}', 'ℤ')
-    text = text.replace('\\mathbb{Q}', 'ℚ')
-    text = text.replace('\\mathbb{C}', 'ℂ')
-    
-    # Accents et symboles divers
-    text = text.replace('\\hat', '̂')
-    text = text.replace('\\bar', '̄')
-    text = text.replace('\\vec', '⃗')
-    text = text.replace('\\dot', '̇')
-    
+
+    # ⚡ Chemin rapide : la grande majorité des chaînes rendues (noms,
+    # libellés, menus) ne contiennent aucun LaTeX — un simple test
+    # d'appartenance évite toute la cascade de substitutions.
+    if '\\' not in text and '$' not in text:
+        return Markup(text)
+
+    for patron, remplacement in _LATEX_SUBS:
+        text = patron.sub(remplacement, text)
+
+    # Exposants et indices : x^{2} → x², x_{10} → x₁₀
+    text = _PUISSANCE_RE.sub(_convertir_puissance, text)
+    text = _INDICE_RE.sub(_convertir_indice, text)
+
+    # Symboles grecs, opérateurs, ensembles, accents : une seule passe
+    text = _SYMBOLES_RE.sub(lambda m: _SYMBOLES_LATEX[m.group(0)], text)
+
     # Équations en display (supprimer les $$)
-    text = re.sub(r'\$\$(.*?)\$\$', r'\1', text, flags=re.DOTALL)
-    text = re.sub(r'\$(.*?)\$', r'\1', text)
-    
+    text = _DISPLAY_MATH_RE.sub(r'\1', text)
+    text = _INLINE_MATH_RE.sub(r'\1', text)
+
     # Nettoyage des doubles backslashes et espaces
     text = text.replace('\\\\', ' ')
-    text = re.sub(r'\s+', ' ', text)  # Normaliser les espaces
-    
-    return Markup(text.strip())
+    # split()/join : même résultat que re.sub(r'\s+', ' ', ...) + strip(),
+    # mais entièrement en C, sans moteur regex
+    text = ' '.join(text.split())
+
+    return Markup(text)
 
 
 # ... ensuite vos routes commencent ici ...
@@ -281,21 +746,29 @@ def eleve_remediations():
     username = request.args.get("username")
     lang = request.args.get("lang", "fr")
 
-    eleve = User.query.filter_by(username=username).first()
+    # joinedload : le niveau part dans la même requête que l'élève
+    eleve = User.query.options(
+        joinedload(User.niveau)
+    ).filter_by(username=username).first()
     if not eleve:
         return "Élève introuvable", 404
 
+    # ⚡ Marquage "vue" en un seul UPDATE groupé : la boucle Python générait
+    # un UPDATE par remédiation au flush. Commit uniquement si des lignes ont
+    # réellement changé — un commit à vide coûte un fsync Postgres par visite.
+    nb_marquees = RemediationSuggestion.query.filter_by(
+        user_id=eleve.id,
+        statut="valide",
+        vue_par_eleve=False
+    ).update({"vue_par_eleve": True}, synchronize_session=False)
+    if nb_marquees:
+        db.session.commit()
+
     remediations = RemediationSuggestion.query.filter_by(
         user_id=eleve.id,
         statut="valide"
     ).order_by(RemediationSuggestion.timestamp.desc()).all()
 
-    # Toutes les remédiations sont marquées comme vues ici :
-    for r in remediations:
-        if not r.vue_par_eleve:
-            r.vue_par_eleve = True
-    db.session.commit()
-
     return render_template(
         "remediations_eleve.html",
         eleve=eleve,
@@ -308,11 +781,9 @@ def generer_reponse_guide_math(question, niveau_eleve, langue="fr", mode_examen=
     Génère une réponse pédagogique POUR UNE QUESTION DE MATHÉMATIQUES
     """
     try:
-        from openai import OpenAI
-        import os
-        
-        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        
+        # Client OpenAI global : réutilise le pool de connexions httpx
+        # (pas de nouvelle poignée de main TLS à chaque question d'élève)
+
         # Construire le système prompt
         if langue == "fr":
             system_content = f"""Tu es un enseignant de mathématiques pour un élève de {niveau_eleve}.
@@ -360,18 +831,25 @@ RESPONSE FORMAT:
         if historique:
             user_content += f"\n\nHistorique récent :\n" + "\n".join([f"- {msg[:100]}..." for msg in historique[-3:]])
         
-        # Appel à OpenAI
-        response = client.chat.completions.create(
+        # Appel à OpenAI en streaming : les tokens arrivent au fil de l'eau
+        # au lieu d'attendre la réponse complète côté serveur
+        flux = client.chat.completions.create(
             model="gpt-3.5-turbo",  # Plus rapide et moins cher que GPT-4
             messages=[
                 {"role": "system", "content": system_content},
                 {"role": "user", "content": user_content}
             ],
             temperature=0.7,
-            max_tokens=800  # Limiter la longueur
+            max_tokens=800,  # Limiter la longueur
+            stream=True
         )
-        
-        reponse = response.choices[0].message.content.strip()
+
+        morceaux = []
+        for chunk in flux:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                morceaux.append(delta)
+        reponse = "".join(morceaux).strip()
         
         # Formater la réponse
         return f"""
@@ -442,6 +920,41 @@ def obtenir_matiere_test_exercice(test_exercice):
     return None
 
 
+# 📚 Constantes partagées, allouées une fois à l'import : ces tables étaient
+# reconstruites à chaque appel des helpers qui les utilisent.
+_MATIERES_FR_EN = {
+    "mathématiques": "mathematics",
+    "français": "french",
+    "histoire": "history",
+    "sciences": "science",
+    "géographie": "geography",
+    "anglais": "english",
+    "espagnol": "spanish",
+    "physique": "physics",
+    "chimie": "chemistry",
+    "biologie": "biology",
+}
+
+_MESSAGES = {
+    "fr": {
+        "essai_termine": "Essai gratuit terminé. Abonne-toi pour continuer.",
+        "je_te_guide": "Je te guide étape par étape !",
+        "erreur_traitement": "Erreur lors du traitement de la question",
+        "bienvenue_enseignant": "👋 Bonjour ! Je suis ton enseignant virtuel. Pose-moi n'importe quelle question sur n'importe quelle matière !",
+        "nouveau_dialogue": "Nouvelle conversation commencée. Pose ta question !",
+        "acces_enseignant": "Accès à l'enseignant virtuel activé !"
+    },
+    "en": {
+        "essai_termine": "Free trial ended. Subscribe to continue.",
+        "je_te_guide": "I'll guide you step by step!",
+        "erreur_traitement": "Error processing the question",
+        "bienvenue_enseignant": "👋 Hello! I'm your virtual teacher. Ask me any question about any subject!",
+        "nouveau_dialogue": "New conversation started. Ask your question!",
+        "acces_enseignant": "Virtual teacher access activated!"
+    }
+}
+
+
 def obtenir_nom_matiere_objet(matiere_obj, lang="fr"):
     """Obtenir le nom de la matière dans la bonne langue depuis un objet Matiere"""
     if not matiere_obj:
@@ -452,36 +965,21 @@ def obtenir_nom_matiere_objet(matiere_obj, lang="fr"):
     else:
         # Retourner le nom anglais s'il existe, sinon le nom français
         nom = matiere_obj.nom_en.lower() if matiere_obj.nom_en else matiere_obj.nom.lower()
-        
-        # Mapping pour les noms courants
-        mapping = {
-            "mathématiques": "mathematics",
-            "français": "french",
-            "histoire": "history", 
-            "sciences": "science",
-            "géographie": "geography",
-            "anglais": "english",
-            "espagnol": "spanish",
-            "physique": "physics",
-            "chimie": "chemistry",
-            "biologie": "biology"
-        }
-        return mapping.get(nom, nom)
+        return _MATIERES_FR_EN.get(nom, nom)
 
 
 # ============ ROUTE ADAPTÉE ============
 @app.route("/enseignant-virtuel", methods=['GET', 'POST'])
 def enseignant_virtuel():
     """Route pour l'enseignant virtuel - Accès libre - BILINGUE"""
-    from datetime import datetime
     
     if "eleve_id" not in session:
         return redirect(url_for("login_eleve"))
 
-    eleve = User.query.options(joinedload(User.niveau)).get(session["eleve_id"])
+    eleve = get_eleve_courant()
     if not eleve or eleve.role != "élève":
         return redirect(url_for("login_eleve"))
-    
+
     # Vérifier l'accès (essai gratuit uniquement)
     lang = session.get("lang", "fr")
     if eleve.essai_est_expire() and eleve.statut_paiement != "paye":
@@ -489,9 +987,9 @@ def enseignant_virtuel():
         flash(get_message("essai_termine", lang), "error")
         return redirect(url_for('login_eleve'))
 
-    # Initialiser la conversation si elle n'existe pas
-    if "conversation" not in session:
-        session["conversation"] = []
+    # 🗂️ Tout l'état de conversation vit sous une seule clé de session :
+    # une seule (dé)sérialisation, et une remise à zéro en un pop("chat")
+    chat_ns = dict(session.get("chat", {}))
     
     # Récupérer la matière sélectionnée ou par défaut
     matiere = "mathématiques" if lang == "fr" else "mathematics"
@@ -505,8 +1003,10 @@ def enseignant_virtuel():
             matiere = matiere_form
         
         if question and len(question) >= 3:
-            conversation = session.get("conversation", [])
-            derniere_q_ia = session.get('derniere_q_ia')
+            # ⚡ deque borné : l'historique ne dépasse jamais 15 messages et
+            # la session n'est resérialisée qu'une fois en fin de branche
+            conversation = deque(chat_ns.get("conversation", []), maxlen=15)
+            derniere_q_ia = chat_ns.get("derniere_q_ia")
             
             # Si c'est une nouvelle conversation, ajouter un message de bienvenue
             if not conversation:
@@ -527,36 +1027,34 @@ def enseignant_virtuel():
                         historique=conversation,
                         niveau=eleve.niveau.nom if eleve.niveau else ("6th grade" if lang == "en" else "6ème"),
                         langue=lang,
-                        mode_examen=session.get("mode_examen", False),
+                        mode_examen=chat_ns.get("mode_examen", False),
                         exercice_context="",
                         matiere=matiere
                     )
-                    session.pop('derniere_q_ia', None)
+                    chat_ns.pop("derniere_q_ia", None)
                 else:
                     # Nouvelle question
                     reponse = generer_debut_conversation(
                         question=question,
                         niveau=eleve.niveau.nom if eleve.niveau else ("6th grade" if lang == "en" else "6ème"),
                         langue=lang,
-                        mode_examen=session.get("mode_examen", False),
+                        mode_examen=chat_ns.get("mode_examen", False),
                         matiere=matiere
                     )
                 
                 # Ajouter la réponse de l'IA
                 enseignant_label = "🤖 Teacher:" if lang == "en" else "🤖 Enseignant:"
                 conversation.append(f"{enseignant_label} {reponse}")
-                
-                # Limiter à 15 messages
-                if len(conversation) > 15:
-                    conversation = conversation[-15:]
-                
-                session["conversation"] = conversation
+
+                # maxlen=15 du deque : la limite est appliquée sans copie
+                chat_ns["conversation"] = list(conversation)
                 
                 # Extraire la nouvelle question
                 nouvelle_q = extraire_question(reponse, lang)
                 if nouvelle_q:
-                    session['derniere_q_ia'] = nouvelle_q
+                    chat_ns["derniere_q_ia"] = nouvelle_q
                 
+                session["chat"] = chat_ns
                 flash(get_message("je_te_guide", lang), "success")
                 
             except Exception as e:
@@ -569,17 +1067,19 @@ def enseignant_virtuel():
                 
                 enseignant_label = "🤖 Teacher:" if lang == "en" else "🤖 Enseignant:"
                 conversation.append(f"{enseignant_label} {fallback_msg}")
-                session["conversation"] = conversation
+                chat_ns["conversation"] = list(conversation)
+                session["chat"] = chat_ns
                 flash(get_message("erreur_traitement", lang), "warning")
     
     # Récupérer la conversation
-    conversation = session.get("conversation", [])
-    
+    conversation = chat_ns.get("conversation", [])
+
     return render_template(
         "enseignant_virtuel.html",
         lang=lang,
         eleve=eleve,
         conversation=conversation,
+        derniere_q_ia=chat_ns.get("derniere_q_ia"),
         exercice_remediation=None,
         access_count=0,
         date_du_jour=datetime.utcnow(),
@@ -589,70 +1089,57 @@ def enseignant_virtuel():
 
 def get_message(key, lang="fr"):
     """Système de messages bilingues"""
-    messages = {
-        "fr": {
-            "essai_termine": "Essai gratuit terminé. Abonne-toi pour continuer.",
-            "je_te_guide": "Je te guide étape par étape !",
-            "erreur_traitement": "Erreur lors du traitement de la question",
-            "bienvenue_enseignant": "👋 Bonjour ! Je suis ton enseignant virtuel. Pose-moi n'importe quelle question sur n'importe quelle matière !",
-            "nouveau_dialogue": "Nouvelle conversation commencée. Pose ta question !",
-            "acces_enseignant": "Accès à l'enseignant virtuel activé !"
-        },
-        "en": {
-            "essai_termine": "Free trial ended. Subscribe to continue.",
-            "je_te_guide": "I'll guide you step by step!",
-            "erreur_traitement": "Error processing the question",
-            "bienvenue_enseignant": "👋 Hello! I'm your virtual teacher. Ask me any question about any subject!",
-            "nouveau_dialogue": "New conversation started. Ask your question!",
-            "acces_enseignant": "Virtual teacher access activated!"
-        }
-    }
-    return messages.get(lang, messages["fr"]).get(key, key)
+    return _MESSAGES.get(lang, _MESSAGES["fr"]).get(key, key)
+
+
+# 🔎 Patrons d'extraction de question précompilés au chargement du module :
+# extraire_question tourne après chaque réponse IA, recompiler 13 patrons
+# par appel est du travail perdu. L'ordre des listes = ordre de priorité.
+_PATRONS_QUESTION_FR = [re.compile(p) for p in (
+    r'[Pp]eux-tu\s+(.*?)\?',
+    r'[Qq]u\'est-ce que\s+(.*?)\?',
+    r'[Cc]alcule\s+(.*?)\?',
+    r'[Tt]rouve\s+(.*?)\?',
+    r'[Dd]is-moi\s+(.*?)\?',
+    r'[Qq]uelle\s+(.*?)\?',
+    r'[Cc]ombien\s+(.*?)\?',
+    r'[Cc]omment\s+(.*?)\?',
+    r'[Pp]ourquoi\s+(.*?)\?',
+    r'[Éé]cris\s+(.*?)\?',
+    r'[Aa]nalyse\s+(.*?)\?',
+    r'[Ee]xplique\s+(.*?)\?',
+    r'[Rr]eformule\s+(.*?)\?',
+)]
+
+_PATRONS_QUESTION_EN = [re.compile(p) for p in (
+    r'[Cc]an you\s+(.*?)\?',
+    r'[Ww]hat is\s+(.*?)\?',
+    r'[Cc]alculate\s+(.*?)\?',
+    r'[Ff]ind\s+(.*?)\?',
+    r'[Tt]ell me\s+(.*?)\?',
+    r'[Ww]hich\s+(.*?)\?',
+    r'[Hh]ow many\s+(.*?)\?',
+    r'[Hh]ow\s+(.*?)\?',
+    r'[Ww]hy\s+(.*?)\?',
+    r'[Ww]rite\s+(.*?)\?',
+    r'[Aa]nalyze\s+(.*?)\?',
+    r'[Ee]xplain\s+(.*?)\?',
+    r'[Dd]escribe\s+(.*?)\?',
+    r'[Rr]ephrase\s+(.*?)\?',
+)]
 
 
 def extraire_question(reponse, lang="fr"):
     """Extrait la question posée par l'IA - version bilingue"""
-    import re
-    
-    # Patterns FRANÇAIS
-    patterns_fr = [
-        r'[Pp]eux-tu\s+(.*?)\?',
-        r'[Qq]u\'est-ce que\s+(.*?)\?',
-        r'[Cc]alcule\s+(.*?)\?',
-        r'[Tt]rouve\s+(.*?)\?',
-        r'[Dd]is-moi\s+(.*?)\?',
-        r'[Qq]uelle\s+(.*?)\?',
-        r'[Cc]ombien\s+(.*?)\?',
-        r'[Cc]omment\s+(.*?)\?',
-        r'[Pp]ourquoi\s+(.*?)\?',
-        r'[Éé]cris\s+(.*?)\?',
-        r'[Aa]nalyse\s+(.*?)\?',
-        r'[Ee]xplique\s+(.*?)\?',
-        r'[Rr]eformule\s+(.*?)\?'
-    ]
-    
-    # Patterns ANGLAIS
-    patterns_en = [
-        r'[Cc]an you\s+(.*?)\?',
-        r'[Ww]hat is\s+(.*?)\?',
-        r'[Cc]alculate\s+(.*?)\?',
-        r'[Ff]ind\s+(.*?)\?',
-        r'[Tt]ell me\s+(.*?)\?',
-        r'[Ww]hich\s+(.*?)\?',
-        r'[Hh]ow many\s+(.*?)\?',
-        r'[Hh]ow\s+(.*?)\?',
-        r'[Ww]hy\s+(.*?)\?',
-        r'[Ww]rite\s+(.*?)\?',
-        r'[Aa]nalyze\s+(.*?)\?',
-        r'[Ee]xplain\s+(.*?)\?',
-        r'[Dd]escribe\s+(.*?)\?',
-        r'[Rr]ephrase\s+(.*?)\?'
-    ]
-    
-    patterns = patterns_fr if lang == "fr" else patterns_en
-    
+    # ⚡ Tous les patrons exigent un « ? » : sans point d'interrogation,
+    # inutile de lancer 13 recherches regex.
+    if '?' not in reponse:
+        return None
+
+    patterns = _PATRONS_QUESTION_FR if lang == "fr" else _PATRONS_QUESTION_EN
+
     for pattern in patterns:
-        match = re.search(pattern, reponse)
+        match = pattern.search(reponse)
         if match:
             question = match.group(1).strip()
             if len(question) > 5:  # Minimum 5 caractères
@@ -661,9 +1148,14 @@ def extraire_question(reponse, lang="fr"):
     return None
 
 
+@lru_cache(maxsize=64)
 def get_system_prompt(matiere="mathématiques", lang="fr", mode_examen=False):
-    """Prompt optimisé par matière et par langue"""
-    
+    """Prompt optimisé par matière et par langue.
+
+    Mémorisé : le résultat ne dépend que de (matiere, lang, mode_examen),
+    inutile de reconstruire les dictionnaires de prompts à chaque message.
+    """
+
     # Dictionnaire des prompts FRANÇAIS
     prompts_fr = {
         "mathématiques": """Tu es un enseignant de mathématiques expert en pédagogie.
@@ -817,14 +1309,7 @@ def get_system_prompt(matiere="mathématiques", lang="fr", mode_examen=False):
     matiere_normalisee = matiere.lower()
     if lang == "en":
         # Mapper les noms français aux noms anglais
-        matieres_map = {
-            "mathématiques": "mathematics",
-            "français": "french", 
-            "histoire": "history",
-            "sciences": "science",
-            "géographie": "geography"
-        }
-        matiere_normalisee = matieres_map.get(matiere_normalisee, matiere_normalisee)
+        matiere_normalisee = _MATIERES_FR_EN.get(matiere_normalisee, matiere_normalisee)
     
     # Récupérer le prompt spécifique ou utiliser les mathématiques comme défaut
     prompt_base = prompts_dict.get(matiere_normalisee, prompts_dict.get("mathematics" if lang == "en" else "mathématiques"))
@@ -866,13 +1351,52 @@ def get_system_prompt(matiere="mathématiques", lang="fr", mode_examen=False):
     return prompt_base + regles_communes
 
 
+def _cle_cache_debut(question, niveau, langue, mode_examen, matiere):
+    """Clé de cache d'une première question normalisée (casse/espaces ignorés)"""
+    question_normalisee = " ".join(question.split()).lower()
+    empreinte = hashlib.sha256(
+        f"{matiere}|{niveau}|{langue}|{int(mode_examen)}|{question_normalisee}".encode("utf-8")
+    ).hexdigest()
+    return f"conv:debut:{empreinte}"
+
+
+# ⚡ Compilées une fois au chargement du module : l'extraction de note sur le
+# chemin de correction se réduit à un scan C, sans repasser par le cache de re
+_NOTE_RE_5 = re.compile(r"(?:Note|Score)\s*:\s*(\d)/5", re.IGNORECASE)
+_NOTE_RE_FALLBACK = re.compile(r"(?:Note|Score)\s*:\s*(\d)", re.IGNORECASE)
+
+
+def _extraire_note(analyse_ia):
+    """Extrait la note X/5 d'une analyse IA ; None si introuvable."""
+    match = _NOTE_RE_5.search(analyse_ia)
+    if match:
+        return int(match.group(1))
+    # Fallback si le format /5 n'est pas respecté
+    match = _NOTE_RE_FALLBACK.search(analyse_ia)
+    if match:
+        return min(int(match.group(1)), 5)  # Limite à 5 maximum
+    return None
+
+
+def _cle_cache_correction(identifiant, lang, reponse_eleve):
+    """Clé de cache d'une correction par réponse normalisée (casse/espaces)."""
+    reponse_normalisee = " ".join(reponse_eleve.split()).lower()
+    empreinte = hashlib.sha256(
+        f"{identifiant}|{lang}|{reponse_normalisee}".encode("utf-8")
+    ).hexdigest()
+    return f"correction:{empreinte}"
+
+
 def generer_debut_conversation(question, niveau, langue="fr", mode_examen=False, matiere="mathématiques"):
     """Début de conversation bilingue adapté à la matière"""
-    from openai import OpenAI
-    import os
-    
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-    
+    # ⚡ Beaucoup de premières questions sont des quasi-doublons (exercices du
+    # manuel copiés-collés par toute une classe) : on court-circuite l'appel
+    # GPT-4 quand la même question normalisée a déjà reçu un premier tour
+    cle_cache = _cle_cache_debut(question, niveau, langue, mode_examen, matiere)
+    reponse_cachee = cache.get(cle_cache)
+    if reponse_cachee:
+        return reponse_cachee
+
     if langue == "fr":
         prompt = f"""Élève de {niveau} en {matiere.upper()} pose la question suivante : "{question}"
 
@@ -915,16 +1439,27 @@ Your role: Start the pedagogical dialogue SPECIFIC TO THE SUBJECT.
 **Important:** Be encouraging and pedagogical!"""
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
+        # stream=True : les tokens sont consommés au fil de l'eau plutôt que
+        # d'attendre l'objet réponse complet côté SDK
+        flux = client.chat.completions.create(
+            model=MODEL_CHAT,
             messages=[
                 {"role": "system", "content": get_system_prompt(matiere, langue, mode_examen)},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7,
-            max_tokens=400
+            max_tokens=400,
+            stream=True
         )
-        return response.choices[0].message.content.strip()
+        reponse = "".join(
+            chunk.choices[0].delta.content
+            for chunk in flux
+            if chunk.choices and chunk.choices[0].delta.content
+        ).strip()
+        # TTL 4h : les questions d'une même séance de classe profitent du hit,
+        # sans figer le premier tour au-delà de la journée
+        cache.set(cle_cache, reponse, timeout=4 * 3600)
+        return reponse
     except Exception as e:
         # Fallback bilingue
         if langue == "fr":
@@ -957,33 +1492,32 @@ Write your rephrasing, and I'll guide you to the method to use!
 💡 *Tip: Start by explaining what you already understand.*"""
 
 
-def generer_suite_conversation(derniere_q, reponse, historique, niveau, langue="fr", mode_examen=False, exercice_context="", matiere="mathématiques"):
-    """Continue la conversation bilingue avec contexte de matière"""
-    from openai import OpenAI
-    import os
-    
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-    
-    # Préparer l'historique contextuel
-    historique_contextuel = []
-    
-    # Ajouter les 10 derniers messages maximum
-    for msg in historique[-10:]:
-        historique_contextuel.append(msg)
-    
-    historique_text = "\n".join(historique_contextuel)
-    
-    if langue == "fr":
-        prompt = f"""Élève de {niveau} en {matiere.upper()}
+# L'historique de conversation est stocké en session sous forme affichable
+# ("👤 Élève: ..." / "🤖 Enseignant: ...") : on mappe ces marqueurs vers les
+# rôles de l'API Chat sans changer le format rendu par le template
+_MARQUEURS_ROLES = (
+    ("🤖", "assistant"),
+    ("👤", "user"),
+)
 
-**HISTORIQUE DE CONVERSATION :**
-{historique_text}
 
-**Dernière question que j'ai posée :** {derniere_q}
-**Réponse de l'élève :** {reponse}
+def _messages_depuis_historique(historique):
+    """Reconvertit l'historique affichable en messages role/content pour l'API"""
+    messages = []
+    for entree in historique:
+        for marqueur, role in _MARQUEURS_ROLES:
+            if entree.startswith(marqueur):
+                messages.append({"role": role, "content": entree.split(":", 1)[-1].strip()})
+                break
+    return messages
+
 
-**Ta tâche ({matiere}) :**
-1. Analyser la réponse de l'élève dans le contexte de {matiere}
+@lru_cache(maxsize=64)
+def _consignes_suivi(matiere, langue, mode_examen):
+    """Consignes pédagogiques du suivi de conversation (stables par matière/langue)"""
+    if langue == "fr":
+        return f"""**Ta tâche à chaque tour ({matiere}) :**
+1. Analyser la dernière réponse de l'élève dans le contexte de {matiere}
 2. Valider ce qui est correct selon les règles de {matiere}
 3. Corriger doucement ce qui est erroné (sans critiquer)
 4. Poser la PROCHAINE QUESTION qui avance vers la compréhension/solution
@@ -998,16 +1532,8 @@ def generer_suite_conversation(derniere_q, reponse, historique, niveau, langue="
 
 {"Mode examen : guide avec des indices, ne révèle pas les étapes." if mode_examen else ""}"""
     else:
-        prompt = f"""{niveau} student in {matiere.upper()}
-
-**CONVERSATION HISTORY:**
-{historique_text}
-
-**Last question I asked:** {derniere_q}
-**Student's answer:** {reponse}
-
-**Your task ({matiere}):**
-1. Analyze the student's response in the context of {matiere}
+        return f"""**Your task each turn ({matiere}):**
+1. Analyze the student's latest response in the context of {matiere}
 2. Validate what is correct according to {matiere} rules
 3. Gently correct what is wrong (without criticism)
 4. Ask the NEXT QUESTION that moves toward understanding/solution
@@ -1021,18 +1547,43 @@ def generer_suite_conversation(derniere_q, reponse, historique, niveau, langue="
 - Use concrete examples if needed
 
 {"Exam mode: guide with hints, do not reveal steps." if mode_examen else ""}"""
-    
+
+
+def generer_suite_conversation(derniere_q, reponse, historique, niveau, langue="fr", mode_examen=False, exercice_context="", matiere="mathématiques"):
+    """Continue la conversation bilingue avec contexte de matière"""
+    # ⚡ Prompt caching OpenAI : le préfixe (system + tours précédents) reste
+    # identique d'un tour à l'autre, seul le dernier message change. On passe
+    # donc l'historique en messages role/content au lieu de le reformater
+    # dans un prompt utilisateur qui invalidait le cache à chaque tour.
+    niveau_txt = f"Élève de {niveau}." if langue == "fr" else f"{niveau} student."
+    messages = [{
+        "role": "system",
+        "content": get_system_prompt(matiere, langue, mode_examen)
+        + "\n\n" + niveau_txt
+        + "\n\n" + _consignes_suivi(matiere, langue, mode_examen),
+    }]
+    messages += _messages_depuis_historique(list(historique)[-10:])
+
+    # L'appelant ajoute la réponse de l'élève à l'historique avant l'appel ;
+    # si ce n'est pas le cas, on termine explicitement par un tour "user"
+    if not messages or messages[-1]["role"] != "user" or messages[-1]["content"] != reponse:
+        messages.append({"role": "user", "content": reponse})
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": get_system_prompt(matiere, langue, mode_examen)},
-                {"role": "user", "content": prompt}
-            ],
+        # stream=True : les tokens sont consommés au fil de l'eau plutôt que
+        # d'attendre l'objet réponse complet côté SDK
+        flux = client.chat.completions.create(
+            model=MODEL_CHAT,
+            messages=messages,
             temperature=0.7,
-            max_tokens=450
+            max_tokens=450,
+            stream=True
         )
-        return response.choices[0].message.content.strip()
+        return "".join(
+            chunk.choices[0].delta.content
+            for chunk in flux
+            if chunk.choices and chunk.choices[0].delta.content
+        ).strip()
     except Exception as e:
         # Fallback bilingue
         if langue == "fr":
@@ -1057,14 +1608,6 @@ I'm here to help you move forward step by step!
 ✨ *Remember: every mistake is a learning opportunity!*"""
 
 
-@app.after_request
-def add_header(response):
-    """Ajouter des headers pour empêcher la mise en cache et les rechargements"""
-    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '-1'
-    return response
-
 @app.route("/chat", methods=["POST"])
 def chat():
     from chatbot_utils import get_chatbot_response  # chemin selon ton organisation
@@ -1079,15 +1622,8 @@ def nouvel_exercice():
         return redirect(url_for("login_eleve"))
     
     # Vider TOUTE la session liée à la conversation
-    session_keys_to_remove = [
-        "conversation", 
-        "derniere_q_ia", 
-        "exercice_en_cours",
-        "mode_examen"  # Au cas où
-    ]
-    
-    for key in session_keys_to_remove:
-        session.pop(key, None)
+    # ⚡ un seul pop : tout l'état du chat vit sous la clé "chat"
+    session.pop("chat", None)
     
     # Flash message clair
     flash("🎯 Nouvel exercice prêt ! Pose ta question.", "success")
@@ -1096,30 +1632,27 @@ def nouvel_exercice():
     import time
     return redirect(url_for("enseignant_virtuel") + f"?t={int(time.time())}")
 
-@app.after_request
-def add_headers(response):
-    """Headers anti-cache"""
-    response.headers['Cache-Control'] = 'no-store, no-cache'
-    response.headers['Pragma'] = 'no-cache'
-    return response
-
 @app.after_request
 def after_request(response):
-    """Ajouter des headers pour empêcher la mise en cache"""
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = "0"
+    """Politique de cache HTTP : pages dynamiques non cachées, statiques cachables"""
+    # ⚡ Handler unique — trois handlers after_request réécrivaient les mêmes
+    # en-têtes anti-cache sur chaque réponse. Les assets /static deviennent
+    # cachables longue durée par le navigateur au lieu d'être re-téléchargés.
+    if request.endpoint == "static":
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate"
+        response.headers["Pragma"] = "no-cache"
+        response.headers["Expires"] = "0"
     return response
 
 @app.route("/matiere-par-niveau/<int:niveau_id>")
 def matiere_par_niveau(niveau_id):
-    matieres = Matiere.query.filter_by(niveau_id=niveau_id).all()
-    return jsonify([{"id": m.id, "nom": m.nom} for m in matieres])
+    return jsonify(get_matieres_par_niveau(niveau_id))
 
 @app.route("/unites-par-matiere/<int:matiere_id>")
 def unites_par_matiere(matiere_id):
-    unites = Unite.query.filter_by(matiere_id=matiere_id).all()
-    return jsonify([{"id": u.id, "nom": u.nom} for u in unites])
+    return jsonify(get_unites_par_matiere(matiere_id))
 
 @app.route("/admin/contenus", methods=["GET"])
 @admin_required
@@ -1144,12 +1677,22 @@ def contenus_eleve():
         .joinedload(Unite.tests)
     ).filter_by(username=username).first_or_404()
 
-    # Réponses aux exercices simples
-    responses = StudentResponse.query.filter_by(user_id=eleve.id).all()
-    exercices_faits = {r.exercice_id: r for r in responses}
-
-    # Réponses aux tests sommatifs
-    tests_reponses = {tr.test_id: tr for tr in TestResponse.query.filter_by(user_id=eleve.id).all()}
+    # ⚡ Le template ne fait que tester l'appartenance (ex.id in ...) : on ne
+    # charge que les identifiants, en tuples légers sans construction
+    # d'objets ORM, et en un seul aller-retour UNION ALL pour les exercices
+    # et les tests sommatifs
+    lignes = db.session.execute(
+        select(StudentResponse.exercice_id, literal("exercice"))
+        .where(StudentResponse.user_id == eleve.id)
+        .union_all(
+            select(TestResponse.test_id, literal("test"))
+            .where(TestResponse.user_id == eleve.id)
+        )
+    )
+    exercices_faits = set()
+    tests_reponses = set()
+    for identifiant, genre in lignes:
+        (exercices_faits if genre == "exercice" else tests_reponses).add(identifiant)
 
     return render_template(
         "contenus_eleve.html",
@@ -1161,32 +1704,165 @@ def contenus_eleve():
     )
 
 
-@app.route("/admin/creer-exercice-ia", methods=["GET", "POST"])
-def creer_exercice_ia():
-    # 🔒 Vérification d'accès - maintenant pour enseignants aussi
-    if not session.get("enseignant_id") and not session.get("is_admin"):
-        return redirect("/login-enseignant")
+# ⚙️ Tâches de génération en arrière-plan. La génération IA peut durer
+# 30-120 s : le POST ne fait plus qu'enfiler la tâche puis rend une page
+# d'attente, au lieu de retenir un thread gunicorn pendant tout l'appel.
+# L'état vit dans le cache (Redis en production, donc visible de tous les
+# workers) et le navigateur interroge /admin/tache-status/<id>.
+_EXECUTEUR_TACHES = ThreadPoolExecutor(max_workers=2)
 
-    # Déterminer le tableau de bord de retour
-    if session.get("is_admin"):
-        dashboard_url = "/admin/dashboard"
-    elif session.get("enseignant_id"):
-        dashboard_url = "/dashboard-enseignant"
-    else:
-        dashboard_url = "/"
+# ⚡ Pool dédié aux corrections d'élèves, dimensionné sur les threads gunicorn
+# (8 par worker) et ajustable par variable d'environnement comme le pool DB :
+# les corrections ne font plus la queue derrière les générations admin
+_EXECUTEUR_CORRECTIONS = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CORRECTIONS_MAX_WORKERS", 8))
+)
 
-    import json, re
+# Pool séparé pour les appels spéculatifs lancés depuis une tâche : soumettre
+# dans _EXECUTEUR_TACHES depuis un de ses propres threads risquerait l'interblocage
+_EXECUTEUR_REMEDIATION = ThreadPoolExecutor(max_workers=2)
 
-    niveaux = Niveau.query.all()
-    matieres = Matiere.query.all()
-    unites = Unite.query.all()
-    lecons = Lecon.query.all()
+# 🗂️ Écritures de fichiers uploadés hors du thread de requête : les octets
+# sont lus pendant la requête (le flux werkzeug meurt avec elle), l'écriture
+# disque — lente pour les gros PDF — part sur un thread dédié
+_EXECUTEUR_FICHIERS = ThreadPoolExecutor(max_workers=2)
 
-    if request.method == "POST":
-        niveau_id = request.form.get("niveau_id")
-        matiere_id = request.form.get("matiere_id")
-        unite_id = request.form.get("unite_id")
-        lecon_id = request.form.get("lecon_id")
+
+def _sauvegarder_fichier_async(fichier, chemin_absolu):
+    """Planifie l'écriture du fichier uploadé sans bloquer la requête."""
+    donnees = fichier.read()
+
+    def _ecrire():
+        try:
+            with open(chemin_absolu, "wb") as sortie:
+                sortie.write(donnees)
+        except Exception:
+            logger.exception("Échec d'écriture du fichier %s", chemin_absolu)
+
+    _EXECUTEUR_FICHIERS.submit(_ecrire)
+
+
+def _lancer_tache_generation(travail, executeur=None):
+    """Enfile `travail(tache_id)` et retourne l'identifiant de la tâche."""
+    tache_id = uuid4().hex
+    cache.set(f"tache:{tache_id}", {"statut": "en_cours"}, timeout=3600)
+
+    def _executer():
+        with app.app_context():
+            try:
+                resultat = travail(tache_id)
+                cache.set(f"tache:{tache_id}", {"statut": "terminee", **resultat}, timeout=3600)
+            except Exception:
+                logger.exception("Tâche de génération %s en échec", tache_id)
+                cache.set(f"tache:{tache_id}", {"statut": "echec"}, timeout=3600)
+
+    (executeur or _EXECUTEUR_TACHES).submit(_executer)
+    return tache_id
+
+
+@app.route("/admin/tache-status/<tache_id>")
+def tache_status(tache_id):
+    etat = cache.get(f"tache:{tache_id}")
+    if etat is None:
+        return jsonify({"statut": "inconnue"}), 404
+    return jsonify(etat)
+
+
+# 📐 Schéma strict d'un exercice généré : le décodage contraint côté OpenAI
+# garantit un objet JSON valide avec exactement ces six champs
+_SCHEMA_EXERCICE = {
+    "type": "object",
+    "properties": {
+        champ: {"type": "string"}
+        for champ in (
+            "question_fr", "question_en",
+            "reponse_fr", "reponse_en",
+            "explication_fr", "explication_en",
+        )
+    },
+    "required": [
+        "question_fr", "question_en",
+        "reponse_fr", "reponse_en",
+        "explication_fr", "explication_en",
+    ],
+    "additionalProperties": False,
+}
+
+
+def _generer_elements_ia(message_system, construire_prompt, nb):
+    """Génère nb éléments pédagogiques via nb petits appels GPT-4 parallèles.
+
+    ⚡ Un seul gros appel « N exercices dans un même JSON » risque la
+    troncature dès N=5 (max_tokens partagé entre tous les exercices). On
+    préfère N appels courts — un objet JSON chacun, max_tokens=800 — lancés
+    en parallèle sur des threads, le même modèle d'exécution que les
+    workers gthread de gunicorn. La latence totale est celle du plus lent
+    des N appels, pas leur somme.
+    """
+    def _generer_un(indice):
+        response = client.chat.completions.create(
+            model=MODEL_GEN,
+            messages=[
+                {"role": "system", "content": message_system},
+                {"role": "user", "content": construire_prompt(indice)},
+            ],
+            # Structured Outputs : le décodage contraint garantit un objet
+            # conforme au schéma, la réparation json-repair ne reste qu'en
+            # filet. Plus de plafond max_tokens arbitraire : la longueur est
+            # bornée par le contenu de l'exercice lui-même.
+            response_format={
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "exercice",
+                    "strict": True,
+                    "schema": _SCHEMA_EXERCICE,
+                },
+            },
+            # Température légèrement variée d'un appel à l'autre pour
+            # diversifier les exercices de la série
+            temperature=0.7 + 0.1 * (indice % 3),
+        )
+        contenu = response.choices[0].message.content.strip()
+        try:
+            # ⚡ orjson : parsing natif, nettement plus rapide que le json
+            # stdlib sur les contenus accentués des exercices
+            return orjson.loads(contenu)
+        except orjson.JSONDecodeError:
+            # 🧹 Réparation linéaire (clôtures de code Markdown, virgules
+            # finales, antislashs LaTeX non échappés, troncature) plutôt que
+            # le re.sub à lookbehind sur tout le blob : on ne jette plus
+            # l'appel GPT-4 pour un simple écart de format
+            return orjson.loads(repair_json(contenu))
+
+    with ThreadPoolExecutor(max_workers=min(nb, 5)) as pool:
+        return list(pool.map(_generer_un, range(nb)))
+
+
+@app.route("/admin/creer-exercice-ia", methods=["GET", "POST"])
+def creer_exercice_ia():
+    # 🔒 Vérification d'accès - maintenant pour enseignants aussi
+    if not session.get("enseignant_id") and not session.get("is_admin"):
+        return redirect("/login-enseignant")
+
+    # Déterminer le tableau de bord de retour
+    if session.get("is_admin"):
+        dashboard_url = "/admin/dashboard"
+    elif session.get("enseignant_id"):
+        dashboard_url = "/dashboard-enseignant"
+    else:
+        dashboard_url = "/"
+
+
+    # ⚡ Seul le menu des niveaux est rendu côté serveur (matières/unités/
+    # leçons sont chargées en AJAX via les endpoints déjà memoizés) : un seul
+    # accès cache au lieu de quatre SELECT pleine table par affichage
+    niveaux = get_tous_niveaux()
+
+    if request.method == "POST":
+        niveau_id = request.form.get("niveau_id")
+        matiere_id = request.form.get("matiere_id")
+        unite_id = request.form.get("unite_id")
+        lecon_id = request.form.get("lecon_id")
         objectif = request.form.get("objectif")
         difficulte = request.form.get("difficulte")
         nb_exercices = int(request.form.get("nb_exercices", 1))
@@ -1205,8 +1881,9 @@ def creer_exercice_ia():
         unite = Unite.query.get(unite_id)
         lecon = Lecon.query.get(lecon_id)
 
-        # ✅ Prompt amélioré avec spécification claire du nombre
-        prompt = f"""
+        # ✅ Prompt par exercice : chaque appel ne génère qu'un objet JSON court
+        def construire_prompt(indice):
+            return f"""
 Tu es un générateur d'exercices pédagogiques.
 
 Contexte pédagogique :
@@ -1218,107 +1895,115 @@ Contexte pédagogique :
 - Difficulté : {difficulte}
 
 Consigne :
-Génère exactement {nb_exercices} exercices distincts, clairs, variés et bien structurés, adaptés au niveau donné.
-Les exercices doivent être diversifiés (types différents, approches différentes).
+Génère UN SEUL exercice clair et bien structuré, adapté au niveau donné.
+C'est l'exercice {indice + 1} d'une série de {nb_exercices} : varie le type et l'approche par rapport aux autres exercices de la série.
 Si un exemple est fourni, inspire-toi du style mais ne le copie pas.
 
 ⚠️ Important :
 - Si tu écris des formules mathématiques, encadre-les avec des dollars `$...$` ou `$$...$$` (compatibilité LaTeX).
-- Réponds uniquement avec un JSON **valide**, sans texte avant ni après.
+- Réponds uniquement avec un objet JSON **valide**, sans texte avant ni après.
 - Ne jamais échapper les dollars ni les backslashes (\\) dans les formules.
 
 Format strict attendu :
-[
-  {{
-    "question_fr": "Question en français ici...",
-    "question_en": "Question in English here...",
-    "reponse_fr": "Réponse en français ici...",
-    "reponse_en": "Answer in English here...",
-    "explication_fr": "Explication détaillée en français...",
-    "explication_en": "Detailed explanation in English..."
-  }},
-  ... (exactement {nb_exercices} exercices)
-]
+{{
+  "question_fr": "Question en français ici...",
+  "question_en": "Question in English here...",
+  "reponse_fr": "Réponse en français ici...",
+  "reponse_en": "Answer in English here...",
+  "explication_fr": "Explication détaillée en français...",
+  "explication_en": "Detailed explanation in English..."
+}}
 
 {f"Exemple à titre d'inspiration : {exemple}" if exemple else ""}
-
-💡 Astuce : Crée des exercices complémentaires qui couvrent différents aspects de l'objectif pédagogique.
 """
 
-        # 🧠 Appel à l'API OpenAI
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "Tu es un générateur d'exercices pédagogiques JSON pur. Génère toujours le nombre exact d'exercices demandé."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=3500,  # Augmenté pour plusieurs exercices
-                temperature=0.7,
-            )
-        except Exception as e:
-            return f"Erreur lors de l'appel OpenAI : {e}", 500
+        lecon_id_cible = lecon.id
 
-        contenu = response.choices[0].message.content.strip()
-        print("📘 Réponse brute GPT :\n", contenu)
-
-        # 🔍 Extraction du JSON pur
-        try:
-            match = re.search(r"\[.*\]", contenu, re.DOTALL)
-            if not match:
-                raise ValueError("Aucun tableau JSON détecté dans la réponse.")
-            json_text = match.group(0)
-
-            # 🧹 Étape critique : corriger les antislashs invalides
-            json_text = re.sub(r'(?<!\\)\\(?!["\\/bfnrtu])', r'\\\\', json_text)
-
-            # 🧩 Parsing JSON
-            data = json.loads(json_text)
-            
-            # ✅ Vérification du nombre d'exercices générés
-            if len(data) != nb_exercices:
-                print(f"⚠️ GPT a généré {len(data)} exercices au lieu de {nb_exercices}")
-
-        except Exception as e:
-            print("❌ Erreur JSON :", e)
-            return f"Erreur de parsing JSON : {e}<br><br>Réponse brute de l'IA :<pre>{contenu}</pre>", 500
-
-        # 💾 Enregistrement des exercices générés
-        exercices_crees = []
-        for ex in data:
-            exercice = Exercice(
-                lecon_id=lecon.id,
-                question_fr=ex.get("question_fr", "").strip(),
-                question_en=ex.get("question_en", "").strip(),
-                reponse_fr=ex.get("reponse_fr", "").strip(),
-                reponse_en=ex.get("reponse_en", "").strip(),
-                explication_fr=ex.get("explication_fr", "").strip(),
-                explication_en=ex.get("explication_en", "").strip(),
-                temps=60
+        # 🧠 ⚡ Génération en arrière-plan : fan-out d'appels parallèles puis
+        # enregistrement, sans retenir le thread de la requête POST
+        def _travail(tache_id):
+            data = _generer_elements_ia(
+                "Tu es un générateur d'exercices pédagogiques JSON pur. Tu réponds avec un seul objet JSON, sans texte avant ni après.",
+                construire_prompt,
+                nb_exercices,
             )
-            db.session.add(exercice)
-            db.session.flush()  # Pour obtenir l'ID
-            exercices_crees.append(exercice)
-
-        db.session.commit()
+            # 💾 add_all + un seul commit : un INSERT multi-lignes
+            # (executemany) au lieu d'un aller-retour flush par exercice
+            exercices_crees = [
+                Exercice(
+                    lecon_id=lecon_id_cible,
+                    question_fr=ex.get("question_fr", "").strip(),
+                    question_en=ex.get("question_en", "").strip(),
+                    reponse_fr=ex.get("reponse_fr", "").strip(),
+                    reponse_en=ex.get("reponse_en", "").strip(),
+                    explication_fr=ex.get("explication_fr", "").strip(),
+                    explication_en=ex.get("explication_en", "").strip(),
+                    temps=60
+                )
+                for ex in data
+            ]
+            try:
+                db.session.add_all(exercices_crees)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            return {
+                "exercice_ids": [e.id for e in exercices_crees],
+                "lecon_id": lecon_id_cible,
+                "redirect": f"/admin/exercices-crees/{tache_id}",
+            }
 
-        # ✅ Afficher la page de confirmation
+        tache_id = _lancer_tache_generation(_travail)
         return render_template(
-            "exercices_crees.html",
-            nombre=len(exercices_crees),
-            lecon=lecon,
-            exercices=exercices_crees,  # Passer les exercices pour affichage
+            "generation_en_cours.html",
+            tache_id=tache_id,
             lang=session.get("lang", "fr"),
             dashboard_url=dashboard_url
         )
 
     # Si GET → afficher le formulaire
+    # ⚡ Le HTML rendu n'est fonction que de (niveaux, langue, dashboard) :
+    # on cache le fragment rendu et on saute entièrement Jinja sur un hit
+    cle_fragment = f"form:exercice_ia:{session.get('lang', 'fr')}:{dashboard_url}"
+    html = cache.get(cle_fragment)
+    if html is None:
+        html = render_template(
+            "form_creer_exercice_ia.html",
+            niveaux=niveaux,
+            lang=session.get("lang", "fr"),
+            dashboard_url=dashboard_url
+        )
+        cache.set(cle_fragment, html, timeout=600)
+    return html
+
+
+@app.route("/admin/exercices-crees/<tache_id>")
+def exercices_crees_resultat(tache_id):
+    # 🔒 Vérification d'accès - pour enseignants et admin
+    if not session.get("enseignant_id") and not session.get("is_admin"):
+        return redirect("/login-enseignant")
+
+    if session.get("is_admin"):
+        dashboard_url = "/admin/dashboard"
+    elif session.get("enseignant_id"):
+        dashboard_url = "/dashboard-enseignant"
+    else:
+        dashboard_url = "/"
+
+    etat = cache.get(f"tache:{tache_id}")
+    if not etat or etat.get("statut") != "terminee":
+        return redirect("/admin/creer-exercice-ia")
+
+    lecon = Lecon.query.get_or_404(etat["lecon_id"])
+    exercices = Exercice.query.filter(Exercice.id.in_(etat["exercice_ids"])).all()
+
+    # ✅ Afficher la page de confirmation
     return render_template(
-        "form_creer_exercice_ia.html",
-        niveaux=niveaux,
-        matieres=matieres,
-        unites=unites,
-        lecons=lecons,
+        "exercices_crees.html",
+        nombre=len(exercices),
+        lecon=lecon,
+        exercices=exercices,
         lang=session.get("lang", "fr"),
         dashboard_url=dashboard_url
     )
@@ -1338,11 +2023,10 @@ def creer_test_sommatif_ia():
     else:
         dashboard_url = "/"
 
-    import json, re
 
-    niveaux = Niveau.query.all()
-    matieres = Matiere.query.all()
-    unites = Unite.query.all()
+    # ⚡ Seul le menu des niveaux est rendu côté serveur, les autres listes
+    # arrivent en AJAX via les endpoints memoizés
+    niveaux = get_tous_niveaux()
 
     if request.method == "POST":
         niveau_id = request.form.get("niveau_id")
@@ -1360,8 +2044,9 @@ def creer_test_sommatif_ia():
         matiere = Matiere.query.get(matiere_id)
         unite = Unite.query.get(unite_id)
 
-        # ✅ Prompt amélioré avec instructions PLUS STRICTES
-        prompt = f"""
+        # ✅ Prompt par question : chaque appel ne génère qu'un objet JSON court
+        def construire_prompt(indice):
+            return f"""
 Tu es un générateur de tests sommatifs pédagogiques.
 
 CONTEXTE PÉDAGOGIQUE :
@@ -1369,208 +2054,104 @@ CONTEXTE PÉDAGOGIQUE :
 - Matière : {matiere.nom}
 - Unité : {unite.nom}
 - Difficulté : {difficulte}
-- Nombre de questions : {nb_questions} (EXACTEMENT {nb_questions} QUESTIONS)
 
 CONSIGNES STRICTES :
-1. Génère EXACTEMENT {nb_questions} questions - PAS PLUS, PAS MOINS
-2. Chaque question doit être en français et en anglais
-3. Format de réponse EXCLUSIVEMENT en JSON valide
+1. Génère UNE SEULE question de test sommatif — c'est la question {indice + 1} d'un test qui en compte {nb_questions}, varie le type et la notion évaluée par rapport aux autres
+2. La question doit être en français et en anglais
+3. Format de réponse EXCLUSIVEMENT en JSON valide (un seul objet)
 4. Pas de texte avant ou après le JSON
 5. Pour les formules mathématiques, utilise $$...$$ pour l'affichage et $...$ pour l'inline
-6. STOP après {nb_questions} questions
 
 FORMAT JSON OBLIGATOIRE :
-[
-  {{
-    "question_fr": "Question en français...",
-    "question_en": "Question in English...",
-    "reponse_fr": "Réponse en français...",
-    "reponse_en": "Answer in English...",
-    "explication_fr": "Explication en français...",
-    "explication_en": "Explanation in English..."
-  }}
-]
+{{
+  "question_fr": "Question en français...",
+  "question_en": "Question in English...",
+  "reponse_fr": "Réponse en français...",
+  "reponse_en": "Answer in English...",
+  "explication_fr": "Explication en français...",
+  "explication_en": "Explanation in English..."
+}}
 
 {f"EXEMPLE D'INSPIRATION (ne pas copier) : {exemple}" if exemple else ""}
 
-IMPORTANT : 
-- Réponds UNIQUEMENT avec le JSON, sans commentaires
-- EXACTEMENT {nb_questions} questions
-- STOP après {nb_questions} questions
+IMPORTANT : Réponds UNIQUEMENT avec l'objet JSON, sans commentaires.
 """
 
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": f"Tu es un assistant qui génère EXCLUSIVEMENT du JSON valide pour des tests pédagogiques. Tu génères EXACTEMENT le nombre de questions demandé. Tu ne réponds qu'avec du JSON, sans texte avant ni après."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=4000,
-                temperature=0.7,
+        unite_id_cible = unite.id
+
+        # 🧠 ⚡ Génération en arrière-plan : une question par appel parallèle,
+        # puis enregistrement — sans retenir le thread de la requête POST.
+        # Le gros appel unique à max_tokens=4000 se tronquait régulièrement
+        # et faisait perdre la réponse entière ; ici un échec éventuel ne
+        # coûte qu'une question.
+        def _travail(tache_id):
+            data = _generer_elements_ia(
+                "Tu es un assistant qui génère EXCLUSIVEMENT du JSON valide pour des tests pédagogiques. Tu réponds avec un seul objet JSON, sans texte avant ni après.",
+                construire_prompt,
+                nb_questions,
             )
-        except Exception as e:
-            return f"Erreur lors de l'appel OpenAI : {e}", 500
 
-        contenu = response.choices[0].message.content.strip()
-        print("📘 Réponse brute GPT :\n", contenu)
-        
-        # Vérifier si la réponse est tronquée
-        if "..." in contenu and not contenu.strip().endswith("]"):
-            print("⚠️ Réponse GPT tronquée détectée")
-            return f"Erreur : La réponse de l'IA est tronquée. Essayez avec moins de questions ou réessayez.<br><br>Réponse partielle :<pre>{contenu}</pre>", 500
-
-        # 🔍 Extraction et nettoyage du JSON - APPROCHE SIMPLIFIÉE
-        try:
-            # Nettoyer d'abord la réponse
-            contenu_clean = contenu.strip()
-            
-            # Supprimer les éventuels backticks de code
-            if contenu_clean.startswith("```json"):
-                contenu_clean = contenu_clean[7:]
-            elif contenu_clean.startswith("```"):
-                contenu_clean = contenu_clean[3:]
-            if contenu_clean.endswith("```"):
-                contenu_clean = contenu_clean[:-3]
-            contenu_clean = contenu_clean.strip()
-            
-            print("🔧 Contenu après nettoyage initial :\n", contenu_clean)
-            
-            # APPROCHE DIRECTE - Essayer de parser directement d'abord
-            try:
-                data = json.loads(contenu_clean)
-                print("✅ JSON parsé directement sans extraction")
-            except json.JSONDecodeError as first_error:
-                print("⚠️ Premier parsing échoué, tentative d'extraction...")
-                
-                # Si le parsing direct échoue, essayer d'extraire le JSON
-                match = re.search(r'\[\s*\{.*\}\s*\]', contenu_clean, re.DOTALL)
-                if not match:
-                    match = re.search(r'\[.*\]', contenu_clean, re.DOTALL)
-                    if not match:
-                        # Dernière tentative : chercher un début de JSON
-                        start_idx = contenu_clean.find('[')
-                        end_idx = contenu_clean.rfind(']')
-                        if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                            json_text = contenu_clean[start_idx:end_idx+1]
-                            print("📄 JSON extrait par indices :\n", json_text)
-                        else:
-                            raise ValueError("Aucun tableau JSON détecté dans la réponse de l'IA.")
-                    else:
-                        json_text = match.group(0)
-                else:
-                    json_text = match.group(0)
-                
-                print("📄 JSON extrait :\n", json_text)
-                
-                # CORRECTION CRITIQUE : Déséchapper les guillemets si nécessaire
-                if '\\"' in json_text:
-                    json_text = json_text.replace('\\"', '"')
-                    print("🔧 Guillemets déséchappés")
-                
-                # Essayer de parser le JSON extrait
-                data = json.loads(json_text)
-                print("✅ JSON extrait parsé avec succès")
-
-        except json.JSONDecodeError as e:
-            print("❌ Erreur de décodage JSON :", e)
-            print("📄 Dernier texte essayé :", contenu_clean if 'data' not in locals() else json_text)
-            
-            # Dernière tentative : essayer avec ast.literal_eval
             try:
-                import ast
-                data = ast.literal_eval(contenu_clean)
-                print("✅ JSON parsé avec ast.literal_eval")
-            except:
-                # Afficher un message d'erreur plus utile
-                error_msg = f"""
-                Erreur de parsing JSON : {e}
-
-                La réponse de l'IA ne respecte pas le format JSON attendu.
-
-                Suggestions :
-                - Réduisez le nombre de questions (essayez avec 3-5 questions)
-                - Vérifiez que l'IA génère exactement le nombre demandé
-                - Réessayez l'opération
-
-                Réponse brute de l'IA :
-                <pre>{contenu}</pre>
-                """
-                return error_msg, 500
-                
-        except Exception as e:
-            print("❌ Erreur générale JSON :", e)
-            return f"Erreur de traitement JSON : {e}<br><br>Réponse brute de l'IA :<pre>{contenu}</pre>", 500
-
-        # Vérifier que nous avons des données
-        if not data or not isinstance(data, list):
-            return "Aucune donnée valide trouvée dans la réponse de l'IA.", 500
-
-        # Vérifier que nous avons le bon nombre de questions
-        questions_recues = len(data)
-        if questions_recues != nb_questions:
-            print(f"⚠️ Nombre de questions générées ({questions_recues}) différent de celui demandé ({nb_questions})")
-            # On continue quand même avec le nombre reçu, mais on avertit
-            # Vous pourriez aussi choisir de retourner une erreur ici
-
-        # 💾 Création du test sommatif principal
-        try:
-            # Créer le test sommatif avec uniquement les champs existants
-            test = TestSommatif(
-                unite_id=unite.id, 
-                temps=temps
-            )
-            db.session.add(test)
-            db.session.flush()
-
-            # 💾 Ajout de chaque question générée comme TestExercice
-            questions_ajoutees = 0
-            for i, q in enumerate(data):
-                # Vérifier que les champs requis existent
-                if q.get("question_fr") and q.get("question_en"):
-                    test_exercice = TestExercice(
-                        test_id=test.id,
-                        question_fr=q.get("question_fr", "").strip(),
-                        question_en=q.get("question_en", "").strip(),
-                        reponse_fr=q.get("reponse_fr", "").strip(),
-                        reponse_en=q.get("reponse_en", "").strip(),
-                        explication_fr=q.get("explication_fr", "").strip(),
-                        explication_en=q.get("explication_en", "").strip()
-                    )
-                    db.session.add(test_exercice)
-                    questions_ajoutees += 1
-
-            db.session.commit()
-            
-            print(f"✅ Test créé avec {questions_ajoutees} questions sur {questions_recues} reçues")
+                # Créer le test sommatif avec uniquement les champs existants
+                test = TestSommatif(
+                    unite_id=unite_id_cible,
+                    temps=temps
+                )
+                db.session.add(test)
+                db.session.flush()
+
+                # 💾 Ajout des questions générées comme TestExercice
+                # ⚡ insert() Core en executemany : un seul INSERT multi-lignes,
+                # sans construction d'instances ORM — les IDs des questions ne
+                # servent à rien ici
+                questions_valides = [
+                    {
+                        "test_id": test.id,
+                        "question_fr": q.get("question_fr", "").strip(),
+                        "question_en": q.get("question_en", "").strip(),
+                        "reponse_fr": q.get("reponse_fr", "").strip(),
+                        "reponse_en": q.get("reponse_en", "").strip(),
+                        "explication_fr": q.get("explication_fr", "").strip(),
+                        "explication_en": q.get("explication_en", "").strip(),
+                    }
+                    for q in data
+                    # Vérifier que les champs requis existent
+                    if q.get("question_fr") and q.get("question_en")
+                ]
+                if not questions_valides:
+                    raise ValueError("Aucune question valide n'a pu être créée à partir de la réponse de l'IA.")
+                db.session.execute(insert(TestExercice), questions_valides)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
 
-            # Si aucune question n'a été ajoutée
-            if questions_ajoutees == 0:
-                return "Aucune question valide n'a pu être créée à partir de la réponse de l'IA.", 500
+            logger.info("✅ Test %s créé avec %s questions sur %s reçues",
+                        test.id, len(questions_valides), len(data))
+            return {"redirect": f"/admin/visualiser-test-sommatif/{test.id}"}
 
-        except Exception as e:
-            db.session.rollback()
-            print("❌ Erreur base de données :", e)
-            return f"Erreur lors de l'enregistrement en base de données : {e}", 500
-
-        # ✅ REDIRECTION VERS LA VISUALISATION après création
+        tache_id = _lancer_tache_generation(_travail)
         return render_template(
-            "test_sommatif_cree.html",
-            nombre=questions_ajoutees,
-            test=test,
+            "generation_en_cours.html",
+            tache_id=tache_id,
             lang=session.get("lang", "fr"),
             dashboard_url=dashboard_url
         )
 
     # 🧩 Page GET : formulaire
-    return render_template(
-        "form_creer_test_sommatif_ia.html",
-        niveaux=niveaux,
-        matieres=matieres,
-        unites=unites,
-        lang=session.get("lang", "fr"),
-        dashboard_url=dashboard_url
-    )
+    # ⚡ Fragment rendu caché par (langue, dashboard), comme le formulaire
+    # de création d'exercices
+    cle_fragment = f"form:test_ia:{session.get('lang', 'fr')}:{dashboard_url}"
+    html = cache.get(cle_fragment)
+    if html is None:
+        html = render_template(
+            "form_creer_test_sommatif_ia.html",
+            niveaux=niveaux,
+            lang=session.get("lang", "fr"),
+            dashboard_url=dashboard_url
+        )
+        cache.set(cle_fragment, html, timeout=600)
+    return html
     
 
 
@@ -1588,8 +2169,11 @@ def visualiser_test_sommatif(test_id):
     else:
         dashboard_url = "/"
 
-    test = TestSommatif.query.get_or_404(test_id)
-    exercices = TestExercice.query.filter_by(test_id=test.id).all()
+    # ⚡ Un seul aller-retour : les questions sont chargées avec le test
+    test = TestSommatif.query.options(
+        selectinload(TestSommatif.exercices)
+    ).get_or_404(test_id)
+    exercices = test.exercices
 
     return render_template(
         "visualiser_test_sommatif.html",
@@ -1612,7 +2196,6 @@ def supprimer_exercice(exercice_id):
 
 @app.route("/eleve/remediation/<int:id>", methods=["GET", "POST"])
 def faire_remediation(id):
-    from datetime import datetime
     eleve_id = session.get("eleve_id")
 
     if not eleve_id:
@@ -1735,29 +2318,36 @@ Correction :
 - Résultat final : [...]
 """
 
-        try:
-            chat_completion = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-            )
-            analyse_ia = chat_completion.choices[0].message.content.strip()
-        except Exception as e:
-            return f"Erreur IA : {e}", 500
-
-        # ✅ EXTRACTION DE NOTE SUR 5
-        etoiles = 0
-        match = re.search(r"(Note|Score)\s*:\s*(\d)/5", analyse_ia, re.IGNORECASE)
-        if match:
-            etoiles = int(match.group(2))
-            print(f"⭐ Note remédiation extraite: {etoiles}/5")
+        # ⚡ Cache de correction : une resoumission de la même réponse (ou la
+        # même réponse d'un autre élève au même exercice suggéré) ne repaie
+        # pas l'appel OpenAI
+        cle_correction = _cle_cache_correction(
+            f"rem:{question}|{reponse_attendue}", lang, reponse_texte
+        )
+        resultat_cache = cache.get(cle_correction)
+        if resultat_cache is not None:
+            analyse_ia = resultat_cache["analyse_ia"]
+            etoiles = resultat_cache["etoiles"]
         else:
-            # Fallback pour l'ancien format
-            match = re.search(r"(Note|Score)\s*:\s*(\d)", analyse_ia, re.IGNORECASE)
-            if match:
-                etoiles = min(int(match.group(2)), 5)  # Limite à 5 maximum
-                print(f"⭐ Note remédiation extraite (sans /5): {etoiles}/5")
+            try:
+                chat_completion = client.chat.completions.create(
+                    model=MODEL_NOTATION,
+                    messages=[{"role": "user", "content": prompt}],
+                )
+                analyse_ia = chat_completion.choices[0].message.content.strip()
+            except Exception as e:
+                return f"Erreur IA : {e}", 500
+
+            # ✅ EXTRACTION DE NOTE SUR 5
+            note = _extraire_note(analyse_ia)
+            if note is not None:
+                print(f"⭐ Note remédiation extraite: {note}/5")
             else:
                 print("⚠️ Impossible d'extraire la note de l'analyse IA")
+            etoiles = note or 0
+
+            cache.set(cle_correction, {"analyse_ia": analyse_ia, "etoiles": etoiles},
+                      timeout=30 * 24 * 3600)
 
         reponse = StudentResponse(
             user_id=eleve.id,
@@ -1810,8 +2400,7 @@ def close_remediation_access():
     session.pop('remediation_access_granted', None)
     session.pop('remediation_exercice_id', None)
     session.pop('remediation_access_count', None)
-    session.pop('conversation', None)
-    session.pop('derniere_q_ia', None)
+    session.pop('chat', None)
     
     flash("🎉 Félicitations ! Tu as terminé la rémédiation.", "success")
     return redirect(url_for('dashboard_eleve'))
@@ -1862,7 +2451,12 @@ def faire_exercice(ex_id):
     lang = request.args.get("lang", "fr")
 
     eleve = User.query.filter_by(username=username).first_or_404()
-    exercice = Exercice.query.get_or_404(ex_id)
+    # 🗄️ Exercice (+ leçon) depuis le cache, réattaché sans SELECT ;
+    # invalidé par événement SQLAlchemy à chaque écriture sur Exercice
+    exercice = get_exercice_cached(ex_id)
+    if exercice is None:
+        abort(404)
+    exercice = db.session.merge(exercice, load=False)
 
     # Vérifier si l'exercice est déjà fait
     reponse_existante = StudentResponse.query.filter_by(
@@ -1905,56 +2499,9 @@ def faire_exercice(ex_id):
         already_completed=bool(reponse_existante)  # Indiquer que l'exercice est déjà terminé
     )
 
-@app.route("/soumettre-reponse", methods=["POST"])
-def soumettre_reponse():
-    from datetime import datetime
-    import re
-
-    print("=== 📝 SOUMISSION RÉPONSE SIMPLE ===")
-    
-    # DEBUG: Afficher tous les champs reçus
-    print("📦 Données reçues:", dict(request.form))
-    
-    # Récupération des données
-    student_id = request.form.get("student_id")
-    exercice_id = request.form.get("exercice_id")
-    reponse_eleve = request.form.get("reponse_eleve", "").strip()
-    redirect_url = request.form.get("redirect_url", "/")
-
-    print(f"Student ID: {student_id}")
-    print(f"Exercice ID: {exercice_id}")
-    print(f"Réponse: {reponse_eleve}")
-
-    # Validation détaillée
-    missing_fields = []
-    if not student_id:
-        missing_fields.append("student_id")
-    if not exercice_id:
-        missing_fields.append("exercice_id")
-    if not reponse_eleve:
-        missing_fields.append("reponse_eleve")
-    
-    if missing_fields:
-        print(f"❌ Champs manquants: {missing_fields}")
-        return f"Données manquantes: {', '.join(missing_fields)}", 400
-
-    eleve = User.query.get(student_id)
-    exercice = Exercice.query.get(exercice_id)
-
-    if not eleve:
-        print("❌ Élève non trouvé")
-        return "Élève non trouvé", 404
-        
-    if not exercice:
-        print("❌ Exercice non trouvé")
-        return "Exercice non trouvé", 404
-
-    lang = eleve.langue if hasattr(eleve, "langue") and eleve.langue == "en" else "fr"
-    question = exercice.question_en if lang == "en" else exercice.question_fr
-
-    # ✅ NOUVEAU PROMPT avec barème sur 5
-    if lang == "en":
-        prompt = f"""
+# ⚡ Gabarits de prompts figés (et .strip() appliqué) au chargement du
+# module : plus de littéral multi-lignes reconstruit à chaque soumission
+_PROMPT_CORRECTION_EN = """
 Correct the student's answer to a school exercise.
 
 📘 Problem statement:
@@ -1985,8 +2532,8 @@ Correction:
 - Expert resolution: [...]
 - Final answer: [...]
 """.strip()
-    else:
-        prompt = f"""
+
+_PROMPT_CORRECTION_FR = """
 Corrige la réponse d'un élève à un exercice scolaire.
 
 📘 Énoncé :
@@ -2018,130 +2565,286 @@ Correction :
 - Résultat final : [...]
 """.strip()
 
-    try:
-        print("🤖 Appel à l'API OpenAI...")
-        chat_completion = client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-        )
-        analyse_ia = chat_completion.choices[0].message.content.strip()
-        print("✅ Analyse IA reçue avec succès")
-    except Exception as e:
-        analyse_ia = f"Erreur IA : {e}"
-        print(f"❌ Erreur lors de l'appel IA: {e}")
-
-    # ✅ EXTRACTION DE NOTE SUR 5
-    etoiles = 0
-    match = re.search(r"(Note|Score)\s*:\s*(\d)/5", analyse_ia, re.IGNORECASE)
-    if match:
-        etoiles = int(match.group(2))
-        print(f"⭐ Note extraite: {etoiles}/5")
-    else:
-        # Fallback si le format /5 n'est pas respecté
-        match = re.search(r"(Note|Score)\s*:\s*(\d)", analyse_ia, re.IGNORECASE)
-        if match:
-            etoiles = min(int(match.group(2)), 5)  # Limite à 5 maximum
-            print(f"⭐ Note extraite (sans /5): {etoiles}/5")
-        else:
-            print("⚠️ Impossible d'extraire la note de l'analyse IA")
-
-    # ✅ GÉNÉRATION DE REMÉDIATION si note < 3/5
-    if etoiles < 3:
-        print(f"🔄 Génération remédiation (note: {etoiles}/5)")
-        if lang == "en":
-            remediation_prompt = f"""
-Generate a new math remediation exercise for a student who scored {etoiles}/5 on the previous exercise.
+_PROMPT_REMEDIATION_EN = """
+Generate a new math remediation exercise for a student who struggled with the previous exercise.
 
 🧩 Context:
 - Original question: {question}
 - Student's answer: {reponse_eleve}
-- Student's score: {etoiles}/5
 
-✍️ Instructions:
-- Create an exercise with equivalent difficulty focusing on the same concepts
-- Adapt the exercise to address the specific difficulties shown in the student's answer
-- Write clear instructions
-- Provide the expected final answer
-- Provide a short hint to guide the student
+✍️ Instructions:
+- Create an exercise with equivalent difficulty focusing on the same concepts
+- Adapt the exercise to address the specific difficulties shown in the student's answer
+- Write clear instructions
+- Provide the expected final answer
+- Provide a short hint to guide the student
+
+🎯 Output format:
+Question: ...
+Expected answer: ...
+Hint: ...
+""".strip()
+
+_PROMPT_REMEDIATION_FR = """
+Génère un nouvel exercice de remédiation en mathématiques pour un élève qui n'a pas réussi l'exercice précédent.
+
+🧩 Contexte :
+- Énoncé initial : {question}
+- Réponse de l'élève : {reponse_eleve}
+
+✍️ Consignes :
+- Crée un exercice de difficulté équivalente ciblant les mêmes concepts
+- Adapte l'exercice pour adresser les difficultés spécifiques montrées dans la réponse de l'élève
+- Rédige un énoncé clair
+- Donne la réponse attendue
+- Fournis un court indice pour aider l'élève
+
+🎯 Format attendu :
+Question : ...
+Réponse attendue : ...
+Indice : ...
+""".strip()
+
+
+@app.route("/soumettre-reponse", methods=["POST"])
+def soumettre_reponse():
+
+    print("=== 📝 SOUMISSION RÉPONSE SIMPLE ===")
+    
+    # DEBUG: Afficher tous les champs reçus
+    print("📦 Données reçues:", dict(request.form))
+    
+    # Récupération des données
+    student_id = request.form.get("student_id")
+    exercice_id = request.form.get("exercice_id")
+    reponse_eleve = request.form.get("reponse_eleve", "").strip()
+    redirect_url = request.form.get("redirect_url", "/")
+
+    print(f"Student ID: {student_id}")
+    print(f"Exercice ID: {exercice_id}")
+    print(f"Réponse: {reponse_eleve}")
+
+    # Validation détaillée
+    missing_fields = []
+    if not student_id:
+        missing_fields.append("student_id")
+    if not exercice_id:
+        missing_fields.append("exercice_id")
+    if not reponse_eleve:
+        missing_fields.append("reponse_eleve")
+    
+    if missing_fields:
+        print(f"❌ Champs manquants: {missing_fields}")
+        return f"Données manquantes: {', '.join(missing_fields)}", 400
+
+    eleve = User.query.get(student_id)
+    # 🗄️ Exercice (+ leçon pour le prompt de remédiation) depuis le cache :
+    # aucun SELECT sur ce chemin critique quand l'exercice y est déjà
+    exercice = get_exercice_cached(int(exercice_id)) if exercice_id.isdigit() else None
+
+    if not eleve:
+        print("❌ Élève non trouvé")
+        return "Élève non trouvé", 404
+        
+    if not exercice:
+        print("❌ Exercice non trouvé")
+        return "Exercice non trouvé", 404
+
+    # Réattacher l'instance du cache : theme/niveau traversent
+    # lecon→unite→matiere et liraient "Thème inconnu" sur un objet détaché
+    exercice = db.session.merge(exercice, load=False)
+
+    lang = eleve.langue if hasattr(eleve, "langue") and eleve.langue == "en" else "fr"
+    question = exercice.question_en if lang == "en" else exercice.question_fr
+
+    # ✅ Prompt de correction avec barème sur 5, depuis le gabarit module
+    prompt = (_PROMPT_CORRECTION_EN if lang == "en" else _PROMPT_CORRECTION_FR).format(
+        question=question, reponse_eleve=reponse_eleve
+    )
+
+    # Valeurs simples capturées avant le départ en tâche de fond : les
+    # instances ORM seront détachées une fois la requête terminée
+    eleve_id = eleve.id
+    exercice_id_int = exercice.id
+    theme_exercice = exercice.theme
+    lecon_titre = exercice.lecon.titre_fr if exercice.lecon else "Général"
+
+    # ⚡ Correction en arrière-plan : l'appel GPT (plusieurs secondes) ne
+    # retient plus le thread de la requête ; le navigateur patiente sur la
+    # page d'attente puis est redirigé vers la rétroaction persistée
+    def _travail(tache_id):
+        # ⚡ Cache de correction : deux réponses identiques (normalisées) au
+        # même exercice partagent analyse, note et remédiation — cas fréquent
+        # des réponses numériques courtes. Aucun appel OpenAI sur un hit.
+        cle_correction = _cle_cache_correction(f"ex:{exercice_id_int}", lang, reponse_eleve)
+        resultat = cache.get(cle_correction)
+        if resultat is not None:
+            analyse_ia = resultat["analyse_ia"]
+            etoiles = resultat["etoiles"]
+            remediation_content = resultat.get("remediation")
+            return _persister_correction(analyse_ia, etoiles, remediation_content)
+
+        # 🗄️ Remédiation partagée entre élèves : l'exercice adapté dépend
+        # surtout de l'énoncé, pas de la copie précise — clé par exercice et
+        # langue, TTL 7 j. Sur un hit, aucun appel spéculatif n'est lancé.
+        cle_remediation = f"rem:{exercice_id_int}:{lang}"
+        remediation_cachee = cache.get(cle_remediation)
+        futur_remediation = None
+        if remediation_cachee is None:
+            # ⚡ Lancement spéculatif : la remédiation ne dépend que de
+            # l'énoncé et de la réponse, pas de la note — elle se génère donc
+            # en parallèle de la correction et n'est conservée que si la note
+            # finale est < 3/5. Léger surcoût d'appel quand l'élève réussit,
+            # contre une latence divisée par deux sur le chemin de l'échec.
+            remediation_prompt = (
+                _PROMPT_REMEDIATION_EN if lang == "en" else _PROMPT_REMEDIATION_FR
+            ).format(question=question, reponse_eleve=reponse_eleve)
+
+            def _generer_remediation():
+                try:
+                    remediation_completion = client.chat.completions.create(
+                        model=MODEL_CHAT,
+                        messages=[{"role": "user", "content": remediation_prompt}],
+                    )
+                    return remediation_completion.choices[0].message.content.strip()
+                except Exception as e:
+                    logger.warning("Erreur génération remédiation: %s", e)
+                    return None
+
+            futur_remediation = _EXECUTEUR_REMEDIATION.submit(_generer_remediation)
+
+        # ⚡ Notation avec le modèle économique ; si la note est illisible,
+        # on relance une fois la correction avec le modèle de dialogue.
+        note = None
+        for modele in (MODEL_NOTATION, MODEL_CHAT):
+            try:
+                # ⚡ stream=True : les fragments arrivent dès le premier token
+                # et sont publiés dans l'état de la tâche — la page d'attente
+                # qui interroge /admin/tache-status affiche l'analyse au fil
+                # de l'eau au lieu d'un écran figé pendant toute la correction
+                flux = client.chat.completions.create(
+                    model=modele,
+                    messages=[{"role": "user", "content": prompt}],
+                    stream=True,
+                )
+                fragments = []
+                for morceau in flux:
+                    delta = morceau.choices[0].delta.content if morceau.choices else None
+                    if delta:
+                        fragments.append(delta)
+                        # Publication par paquets : un aller-retour cache
+                        # tous les ~10 fragments, pas un par token
+                        if len(fragments) % 10 == 0:
+                            cache.set(f"tache:{tache_id}", {
+                                "statut": "en_cours",
+                                "apercu": "".join(fragments),
+                            }, timeout=3600)
+                analyse_ia = "".join(fragments).strip()
+            except Exception as e:
+                analyse_ia = f"Erreur IA : {e}"
+                logger.warning("Erreur lors de l'appel IA de correction: %s", e)
+                break
+
+            note = _extraire_note(analyse_ia)
+            if note is not None:
+                break
+            logger.warning("Note illisible avec %s, relance de la correction", modele)
+
+        if note is None:
+            logger.warning("Impossible d'extraire la note de l'analyse IA")
+        etoiles = note or 0
+
+        # ✅ REMÉDIATION si note < 3/5 : version partagée du cache, sinon le
+        # résultat spéculatif (presque) déjà prêt ; ignorée si l'élève réussit
+        remediation_content = None
+        if etoiles < 3:
+            remediation_content = remediation_cachee
+            if remediation_content is None and futur_remediation is not None:
+                remediation_content = futur_remediation.result()
+                if remediation_content:
+                    cache.set(cle_remediation, remediation_content,
+                              timeout=7 * 24 * 3600)
+
+        # TTL 30 j : la correction d'une réponse donnée est stable
+        if not analyse_ia.startswith("Erreur IA"):
+            cache.set(cle_correction, {
+                "analyse_ia": analyse_ia,
+                "etoiles": etoiles,
+                "remediation": remediation_content,
+            }, timeout=30 * 24 * 3600)
+
+        return _persister_correction(analyse_ia, etoiles, remediation_content)
+
+    def _persister_correction(analyse_ia, etoiles, remediation_content):
+        """Persiste la réponse corrigée (+ suggestion de remédiation éventuelle).
+
+        ⚡ INSERT Core avec RETURNING : l'identifiant revient dans le même
+        aller-retour, sans le cycle flush + refresh de l'ORM — la fenêtre
+        transactionnelle reste minimale (les appels OpenAI sont déjà finis).
+        """
+        try:
+            if remediation_content:
+                # Création de la suggestion de remédiation
+                db.session.execute(insert(RemediationSuggestion).values(
+                    user_id=eleve_id,
+                    theme=theme_exercice,
+                    lecon=lecon_titre,
+                    message=f"Exercice de remédiation proposé automatiquement (note: {etoiles}/5).",
+                    exercice_suggere=remediation_content,
+                    statut="en_attente",
+                    timestamp=datetime.utcnow()
+                ))
+
+            nouvel_id = db.session.execute(
+                insert(StudentResponse).values(
+                    user_id=eleve_id,
+                    exercice_id=exercice_id_int,
+                    reponse_eleve=reponse_eleve,
+                    analyse_ia=analyse_ia,
+                    etoiles=etoiles,
+                    timestamp=datetime.utcnow()
+                ).returning(StudentResponse.id)
+            ).scalar_one()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return {"redirect": f"/feedback/{nouvel_id}"}
 
-🎯 Output format:
-Question: ...
-Expected answer: ...
-Hint: ...
-""".strip()
-        else:
-            remediation_prompt = f"""
-Génère un nouvel exercice de remédiation en mathématiques pour un élève qui a obtenu {etoiles}/5 sur l'exercice précédent.
+    tache_id = _lancer_tache_generation(_travail, executeur=_EXECUTEUR_CORRECTIONS)
+    return render_template(
+        "generation_en_cours.html",
+        tache_id=tache_id,
+        lang=lang,
+        dashboard_url=redirect_url
+    )
 
-🧩 Contexte :
-- Énoncé initial : {question}
-- Réponse de l'élève : {reponse_eleve}
-- Note de l'élève : {etoiles}/5
 
-✍️ Consignes :
-- Crée un exercice de difficulté équivalente ciblant les mêmes concepts
-- Adapte l'exercice pour adresser les difficultés spécifiques montrées dans la réponse de l'élève
-- Rédige un énoncé clair
-- Donne la réponse attendue
-- Fournis un court indice pour aider l'élève
+@app.route("/feedback/<int:response_id>")
+def feedback_reponse(response_id):
+    """Affiche la rétroaction d'une réponse corrigée en arrière-plan"""
+    reponse = StudentResponse.query.get_or_404(response_id)
 
-🎯 Format attendu :
-Question : ...
-Réponse attendue : ...
-Indice : ...
-""".strip()
+    # 🛡️ Seul l'élève qui a soumis la réponse peut consulter sa rétroaction
+    if session.get("eleve_id") != reponse.user_id:
+        flash("Veuillez vous connecter pour consulter votre rétroaction", "error")
+        return redirect(url_for("login_eleve"))
 
-        try:
-            remediation_completion = client.chat.completions.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": remediation_prompt}],
-            )
-            remediation_content = remediation_completion.choices[0].message.content.strip()
-            print("✅ Remédiation générée")
-            
-            # Création de la suggestion de remédiation
-            nouvelle_suggestion = RemediationSuggestion(
-                user_id=eleve.id,
-                theme=exercice.theme,
-                lecon=exercice.lecon.titre_fr if exercice.lecon else "Général",
-                message=f"Exercice de remédiation proposé automatiquement (note: {etoiles}/5).",
-                exercice_suggere=remediation_content,
-                statut="en_attente",
-                timestamp=datetime.utcnow()
-            )
-            db.session.add(nouvelle_suggestion)
-            print("✅ Suggestion de remédiation sauvegardée")
-            
-            # 🆕 IMPORTANT: Autoriser l'accès à l'enseignant virtuel pour cette rémédiation
-            session['remediation_access'] = {
-                'exercice_id': exercice.id,
-                'note': etoiles,
-                'access_count': 0,
-                'first_access': datetime.utcnow().isoformat()
-            }
-            print(f"✅ Accès à l'enseignant virtuel autorisé (note: {etoiles}/5)")
-            
-        except Exception as e:
-            print(f"❌ Erreur génération remédiation: {e}")
+    eleve = User.query.get_or_404(reponse.user_id)
+    exercice = Exercice.query.get_or_404(reponse.exercice_id)
 
-    # Sauvegarde réponse
-    try:
-        nouvelle = StudentResponse(
-            user_id=eleve.id,
-            exercice_id=exercice.id,
-            reponse_eleve=reponse_eleve,
-            analyse_ia=analyse_ia,
-            etoiles=etoiles,
-            timestamp=datetime.utcnow()
-        )
-        db.session.add(nouvelle)
-        db.session.commit()
-        print("✅ Réponse sauvegardée en base de données")
-    except Exception as e:
-        print(f"❌ Erreur lors de la sauvegarde: {e}")
-        return f"Erreur base de données: {e}", 500
+    lang = eleve.langue if hasattr(eleve, "langue") and eleve.langue == "en" else "fr"
 
-    print("=== ✅ RÉPONSE SAUVEGARDÉE ===")
+    # 🆕 Autoriser l'accès à l'enseignant virtuel pour la rémédiation
+    # (déplacé ici : la tâche de fond n'a pas accès à la session)
+    if reponse.etoiles < 3:
+        session['remediation_access'] = {
+            'exercice_id': exercice.id,
+            'note': reponse.etoiles,
+            'access_count': 0,
+            'first_access': datetime.utcnow().isoformat()
+        }
 
     # ✅ Afficher la rétroaction au lieu de rediriger
     return render_template(
@@ -2149,50 +2852,67 @@ Indice : ...
         exercice=exercice,
         eleve=eleve,
         lang=lang,
-        reponse=nouvelle,  # ✅ Rétroaction incluse
+        reponse=reponse,  # ✅ Rétroaction incluse
         show_feedback=True,  # ✅ Flag pour afficher la rétroaction
         already_completed=True,  # ✅ Marquer comme déjà complété
-        show_teacher_button=(etoiles < 3)  # 🆕 Afficher bouton enseignant virtuel si note < 3
+        show_teacher_button=(reponse.etoiles < 3)  # 🆕 Afficher bouton enseignant virtuel si note < 3
     )
 
 
 from sqlalchemy import func
 from sqlalchemy.orm import joinedload
 
-@app.route("/admin/dashboard")
-@admin_required
-def admin_dashboard():
-    lang = request.args.get("lang") or session.get("lang", "fr")
-
-    # Charger la structure complète du contenu
-    niveaux = Niveau.query.options(
-        joinedload(Niveau.matieres)
-        .joinedload(Matiere.unites)
-        .joinedload(Unite.lecons)
-        .joinedload(Lecon.exercices)
-    ).all()
 
-    # Statistiques principales
-    stats = {
-        'enseignants_count': Enseignant.query.count(),
-        'eleves_count': User.query.filter_by(role="élève").count(),
-        'lecons_count': Lecon.query.count(),
-        'tests_count': TestSommatif.query.count(),
-        'exercices_count': Exercice.query.count(),
-        'matieres_count': Matiere.query.count(),
-        'unites_count': Unite.query.count(),
-        'niveaux_count': Niveau.query.count(),
-        'parents_count': Parent.query.count()
-    }
+@cache.memoize(timeout=300)
+def get_eleves_par_niveau():
+    """Effectifs d'élèves par niveau pour le graphique du tableau de bord.
 
-    # Nombre d’élèves par niveau (pour le graphique)
-    eleves_par_niveau = (
+    🗄️ Équivalent applicatif d'une vue matérialisée rafraîchie toutes les
+    5 minutes : l'agrégat O(N élèves) n'est recalculé qu'à l'expiration,
+    pas à chaque affichage.
+    """
+    lignes = (
         db.session.query(Niveau.nom, func.count(User.id))
         .join(User, Niveau.id == User.niveau_id)
         .filter(User.role == "élève")
         .group_by(Niveau.nom)
         .all()
     )
+    return [tuple(ligne) for ligne in lignes]
+
+
+@app.route("/admin/dashboard")
+@admin_required
+def admin_dashboard():
+    lang = request.args.get("lang") or session.get("lang", "fr")
+
+    # 🗄️ Structure complète du contenu depuis le cache (TTL 5 min, invalidé
+    # par les écritures admin) : la base n'est plus interrogée à chaque vue
+    niveaux = get_arbre_contenu()
+
+    # ⚡ Statistiques principales : chaque COUNT devient une sous-requête
+    # scalaire d'un même SELECT — un seul aller-retour SQL au lieu de neuf.
+    def _compteur(modele, *criteres):
+        requete = select(func.count()).select_from(modele)
+        if criteres:
+            requete = requete.where(*criteres)
+        return requete.scalar_subquery()
+
+    ligne_stats = db.session.execute(select(
+        _compteur(Enseignant).label("enseignants_count"),
+        _compteur(User, User.role == "élève").label("eleves_count"),
+        _compteur(Lecon).label("lecons_count"),
+        _compteur(TestSommatif).label("tests_count"),
+        _compteur(Exercice).label("exercices_count"),
+        _compteur(Matiere).label("matieres_count"),
+        _compteur(Unite).label("unites_count"),
+        _compteur(Niveau).label("niveaux_count"),
+        _compteur(Parent).label("parents_count"),
+    )).mappings().one()
+    stats = dict(ligne_stats)
+
+    # Nombre d’élèves par niveau (pour le graphique), servi par le cache
+    eleves_par_niveau = get_eleves_par_niveau()
 
     # Debug console
     print(f"✅ DEBUG - Statistiques calculées : {stats}")
@@ -2212,25 +2932,23 @@ def admin_dashboard():
 @app.route("/admin/tests")
 @admin_required
 def liste_tests():
-    tests = TestSommatif.query.all()
+    # Chargement anticipé : évite une requête par test pour l'unité et les exercices
+    tests = TestSommatif.query.options(
+        joinedload(TestSommatif.unite),
+        selectinload(TestSommatif.exercices)
+    ).all()
     return render_template("liste_tests.html", tests=tests, lang=session.get("lang", "fr"))
 
-def generer_description_auto(exercice_id):
-    """Génère automatiquement les descriptions d'image pour un exercice"""
-    exercice = db.session.get(Exercice, exercice_id)
-    
-    if not exercice or not exercice.chemin_image:
-        return False
-    
-    try:
-        prompt = f"""
+# ⚡ Gabarit figé au chargement du module : la migration appelle ce prompt M
+# fois, autant ne pas reconstruire le littéral multi-lignes à chaque passage
+_PROMPT_DESCRIPTION_IMAGE = """
 Tu es un expert en pédagogie. Analyse cet exercice scolaire et génère une description concise de l'image qui aidera une IA à comprendre les éléments visuels importants.
 
 CONTEXTE:
-- Question FR: {exercice.question_fr}
-- Question EN: {exercice.question_en}
-- Thème: {exercice.theme}
-- Niveau: {exercice.niveau}
+- Question FR: {question_fr}
+- Question EN: {question_en}
+- Thème: {theme}
+- Niveau: {niveau}
 
 Génère une description concise (1 phrase) qui capture les éléments visuels essentiels pour résoudre l'exercice.
 
@@ -2239,27 +2957,39 @@ DESC_FR: [description en français]
 DESC_EN: [description en anglais]
 KEYWORDS: [mots-clés en anglais séparés par des virgules]
 """
-        
+
+
+def _calculer_description_image(exercice):
+    """Calcule les descriptions d'image d'un exercice, sans toucher à la base.
+
+    Retourne ``(valeurs, succes)`` où ``valeurs`` est un dict prêt pour
+    ``bulk_update_mappings`` (avec replis génériques si l'appel IA échoue).
+    """
+    try:
+        prompt = _PROMPT_DESCRIPTION_IMAGE.format(
+            question_fr=exercice.question_fr,
+            question_en=exercice.question_en,
+            theme=exercice.theme,
+            niveau=exercice.niveau,
+        )
+
         response = client.chat.completions.create(
-            model="gpt-4",  # ou "gpt-3.5-turbo" pour économiser
+            model=MODEL_NOTATION,  # tâche descriptive simple : le modèle économique suffit
             messages=[{"role": "user", "content": prompt}],
             max_tokens=200,
             temperature=0.3
         )
-        
+
         content = response.choices[0].message.content.strip()
-        
-        # Extraction des valeurs
-        def extract_value(text, key):
-            for line in text.split('\n'):
-                if line.startswith(key + ':'):
-                    return line.replace(key + ':', '').strip()
-            return None
-        
-        desc_fr = extract_value(content, "DESC_FR")
-        desc_en = extract_value(content, "DESC_EN") 
-        keywords = extract_value(content, "KEYWORDS")
-        
+
+        # Extraction en une seule passe : clé -> valeur ligne par ligne
+        champs = dict(
+            ligne.split(':', 1) for ligne in content.splitlines() if ':' in ligne
+        )
+        desc_fr = champs.get("DESC_FR", "").strip()
+        desc_en = champs.get("DESC_EN", "").strip()
+        keywords = champs.get("KEYWORDS", "").strip()
+
         # Valeurs par défaut si extraction échoue
         if not desc_fr:
             desc_fr = f"Graphique illustrant l'exercice sur {exercice.theme}"
@@ -2267,49 +2997,124 @@ KEYWORDS: [mots-clés en anglais séparés par des virgules]
             desc_en = f"Graph illustrating the exercise about {exercice.theme}"
         if not keywords:
             keywords = "math, graph, exercise"
-        
-        # Mise à jour de l'exercice
-        exercice.image_description_fr = desc_fr
-        exercice.image_description_en = desc_en
-        exercice.image_keywords = keywords
-        
-        db.session.commit()
-        print(f"✅ Description générée pour l'exercice {exercice_id}: {desc_fr[:50]}...")
-        return True
-        
+
+        return {
+            "id": exercice.id,
+            "image_description_fr": desc_fr,
+            "image_description_en": desc_en,
+            "image_keywords": keywords,
+        }, True
+
     except Exception as e:
-        print(f"❌ Erreur génération description pour {exercice_id}: {e}")
+        print(f"❌ Erreur génération description pour {exercice.id}: {e}")
         # Valeurs par défaut en cas d'erreur
-        exercice.image_description_fr = f"Élément visuel pour l'exercice de {exercice.theme}"
-        exercice.image_description_en = f"Visual element for {exercice.theme} exercise"
-        exercice.image_keywords = "math, visual"
-        db.session.commit()
+        return {
+            "id": exercice.id,
+            "image_description_fr": f"Élément visuel pour l'exercice de {exercice.theme}",
+            "image_description_en": f"Visual element for {exercice.theme} exercise",
+            "image_keywords": "math, visual",
+        }, False
+
+
+def generer_description_auto(exercice_id):
+    """Génère automatiquement les descriptions d'image pour un exercice"""
+    exercice = db.session.get(Exercice, exercice_id)
+
+    if not exercice or not exercice.chemin_image:
         return False
-    
+
+    valeurs, succes = _calculer_description_image(exercice)
+    exercice.image_description_fr = valeurs["image_description_fr"]
+    exercice.image_description_en = valeurs["image_description_en"]
+    exercice.image_keywords = valeurs["image_keywords"]
+    db.session.commit()
+    if succes:
+        print(f"✅ Description générée pour l'exercice {exercice_id}: {valeurs['image_description_fr'][:50]}...")
+    return succes
+
+
 @app.route("/admin/migration-descriptions")
 @admin_required
 def migration_descriptions():
     """Génère les descriptions pour tous les exercices existants avec images"""
-    exercices_avec_images = Exercice.query.filter(
-        Exercice.chemin_image.isnot(None)
+    exercices = db.session.scalars(
+        select(Exercice)
+        .where(Exercice.chemin_image.isnot(None))
+        .order_by(Exercice.id)
     ).all()
-    
+
     results = {
-        "total": len(exercices_avec_images),
+        "total": len(exercices),
         "success": 0,
         "errors": []
     }
-    
-    for exercice in exercices_avec_images:
+
+    # ⚡ Un appel IA par lot de 20 exercices (réponse JSON structurée) au lieu
+    # d'un appel par exercice, et les lots partent en parallèle sur des
+    # threads : M exercices coûtent ~M/20 allers-retours OpenAI au lieu de M
+    TAILLE_LOT = 20
+    lots = [exercices[i:i + TAILLE_LOT] for i in range(0, len(exercices), TAILLE_LOT)]
+
+    def _decrire_lot(lot):
+        """Retourne les lignes de mise à jour d'un lot, en un seul appel IA."""
+        contexte = orjson.dumps([
+            {"id": e.id, "theme": e.theme, "niveau": e.niveau,
+             "question_fr": e.question_fr, "question_en": e.question_en}
+            for e in lot
+        ]).decode()
+        prompt = f"""
+Tu es un expert en pédagogie. Pour chacun des exercices scolaires suivants, génère une description concise (1 phrase) de l'image qui aidera une IA à comprendre les éléments visuels importants.
+
+EXERCICES (JSON) :
+{contexte}
+
+Réponds en JSON avec exactement cette forme :
+{{"descriptions": [{{"id": <id>, "desc_fr": "...", "desc_en": "...", "keywords": "mots-clés en anglais séparés par des virgules"}}]}}
+""".strip()
+        response = client.chat.completions.create(
+            model=MODEL_NOTATION,
+            messages=[{"role": "user", "content": prompt}],
+            response_format={"type": "json_object"},
+            temperature=0.3,
+        )
+        contenu = response.choices[0].message.content.strip()
         try:
-            if generer_description_auto(exercice.id):
-                results["success"] += 1
-                print(f"✅ Traité: {exercice.id}")
-            else:
-                results["errors"].append(f"Exercice {exercice.id}")
-        except Exception as e:
-            results["errors"].append(f"Exercice {exercice.id}: {e}")
-    
+            donnees = orjson.loads(contenu)
+        except Exception:
+            donnees = orjson.loads(repair_json(contenu))
+        par_id = {d.get("id"): d for d in donnees.get("descriptions", [])}
+
+        lignes = []
+        for e in lot:
+            d = par_id.get(e.id) or {}
+            lignes.append(({
+                "id": e.id,
+                "image_description_fr": d.get("desc_fr") or f"Graphique illustrant l'exercice sur {e.theme}",
+                "image_description_en": d.get("desc_en") or f"Graph illustrating the exercise about {e.theme}",
+                "image_keywords": d.get("keywords") or "math, graph, exercise",
+            }, bool(d.get("desc_fr"))))
+        return lignes
+
+    mises_a_jour = []
+    with ThreadPoolExecutor(max_workers=4) as executeur:
+        futurs = {executeur.submit(_decrire_lot, lot): lot for lot in lots}
+        for futur, lot in futurs.items():
+            try:
+                for valeurs, succes in futur.result():
+                    mises_a_jour.append(valeurs)
+                    if succes:
+                        results["success"] += 1
+                    else:
+                        results["errors"].append(f"Exercice {valeurs['id']}")
+            except Exception as e:
+                results["errors"].append(
+                    f"Lot {[ex.id for ex in lot]}: {e}"
+                )
+
+    if mises_a_jour:
+        db.session.bulk_update_mappings(Exercice, mises_a_jour)
+        db.session.commit()
+
     return f"""
     <h1>Migration terminée</h1>
     <p>Total exercices avec images: {results['total']}</p>
@@ -2334,7 +3139,7 @@ def modifier_exercice(id):
             dossier = os.path.join("static", "uploads", "images")
             os.makedirs(dossier, exist_ok=True)
             chemin_absolu = os.path.join(dossier, nom_fichier)
-            fichier.save(chemin_absolu)
+            _sauvegarder_fichier_async(fichier, chemin_absolu)
             exercice.chemin_image = f"uploads/images/{nom_fichier}"
             nouvelle_image = True
 
@@ -2400,14 +3205,14 @@ def modifier_test(test_id):
             if fichier_pdf and fichier_pdf.filename:
                 filename = secure_filename(fichier_pdf.filename)
                 chemin = os.path.join(UPLOAD_FOLDER, filename)
-                fichier_pdf.save(chemin)
+                _sauvegarder_fichier_async(fichier_pdf, chemin)
                 test.chemin_fichier = f"uploads/tests/{filename}"
 
             fichier_corrige = request.files.get("fichier_corrige")
             if fichier_corrige and fichier_corrige.filename:
                 filename = secure_filename(fichier_corrige.filename)
                 chemin = os.path.join(UPLOAD_FOLDER, filename)
-                fichier_corrige.save(chemin)
+                _sauvegarder_fichier_async(fichier_corrige, chemin)
                 test.chemin_corrige = f"uploads/tests/{filename}"
 
             # Mise à jour des exercices
@@ -2587,7 +3392,9 @@ def supprimer_enseignant():
 
 @app.route("/liste-enseignants")
 def liste_enseignants():
-    enseignants = Enseignant.query.all()
+    # 🗄️ Liste servie depuis le cache (tuples simples, pas d'instances ORM) ;
+    # invalidée par événement SQLAlchemy à chaque écriture sur Enseignant
+    enseignants = get_liste_enseignants()
     return render_template("liste_enseignants.html", enseignants=enseignants)
 
 @app.route("/logout")
@@ -2625,8 +3432,8 @@ def inscription_enseignant():
             flash("Tous les champs sont requis", "error")
             return render_template("inscription_enseignant.html")
 
-        # Vérifier si l'email existe déjà
-        if Enseignant.query.filter_by(email=email.strip()).first():
+        # Vérifier si l'email existe déjà — EXISTS scalaire, pas de ligne rapatriée
+        if db.session.query(Enseignant.query.filter_by(email=email.strip()).exists()).scalar():
             flash("Un enseignant avec cet email existe déjà.", "error")
             return render_template("inscription_enseignant.html")
 
@@ -2715,13 +3522,18 @@ def login_parent():
     if request.method == "POST":
         email = request.form.get("email")
         
-        # Vérifier que le parent existe
-        parent = Parent.query.filter_by(email=email).first()
-        
+        # ⚡ Parent + nombre d'enfants en une seule requête (jointure externe
+        # agrégée) au lieu de deux allers-retours successifs
+        ligne = (
+            db.session.query(Parent, func.count(ParentEleve.id))
+            .outerjoin(ParentEleve, ParentEleve.parent_id == Parent.id)
+            .filter(Parent.email == email)
+            .group_by(Parent.id)
+            .first()
+        )
+        parent, nb_enfants = ligne if ligne else (None, 0)
+
         if parent:
-            # Vérifier qu'il a au moins un enfant
-            nb_enfants = ParentEleve.query.filter_by(parent_id=parent.id).count()
-            
             if nb_enfants > 0:
                 session["parent_email"] = parent.email
                 return redirect(url_for("parent_dashboard"))
@@ -2751,9 +3563,12 @@ def connexion():
         email = request.form.get('email')
         mot_de_passe = request.form.get('mot_de_passe')
         
-        # Chercher l'utilisateur dans la base
-        user = User.query.filter_by(email=email).first()
-        
+        # Chercher l'utilisateur dans la base — seules les colonnes utiles à
+        # l'authentification sont hydratées
+        user = User.query.options(load_only(
+            User.id, User.username, User.role, User.mot_de_passe_hash,
+        )).filter_by(email=email).first()
+
         if user and user.verifier_mot_de_passe(mot_de_passe):
             # Connecter selon le rôle
             if user.role == 'élève':
@@ -2783,7 +3598,6 @@ from flask import request, render_template, redirect, url_for, flash, session
 def inscription_eleve():
     from forms import InscriptionEleveForm
     from models import Niveau, User, Parent, ParentEleve, db
-    from datetime import datetime, timedelta
     
     form = InscriptionEleveForm()
     
@@ -2794,15 +3608,8 @@ def inscription_eleve():
     if request.method == 'POST' and form.validate_on_submit():
         plan_type = request.form.get('plan_type', 'annual')
         print(f"📋 Plan reçu depuis le formulaire: {plan_type}")
-        # Vérifier les doublons
-        if User.query.filter_by(email=form.email.data).first():
-            flash("Cet email est déjà utilisé", "error")
-            return render_template("inscription_eleve.html", form=form, lang=session.get('lang', 'fr'))
-        
-        if User.query.filter_by(username=form.username.data).first():
-            flash("Ce nom d'utilisateur est déjà utilisé", "error")
-            return render_template("inscription_eleve.html", form=form, lang=session.get('lang', 'fr'))
-        
+        # ⚡ Plus de requêtes de pré-vérification : les index uniques sur
+        # email/username font foi, l'IntegrityError est interceptée plus bas
         # Récupérer le type de plan choisi - CORRECTION ICI
         plan_type = request.form.get('plan_type', 'annual')
         print(f"📋 Plan choisi par l'utilisateur: {plan_type}")  # Debug
@@ -2867,90 +3674,16 @@ def inscription_eleve():
                 if not stripe.api_key:
                     raise Exception("Stripe non configuré")
                 
-                # NOUVEAUX TARIFS : Déterminer le prix selon le plan
-                plan_config = {
-                    'weekly': {
-                        'amount': 1500,  # 15.00 CAD
-                        'description': "Abonnement hebdomadaire - Tutorat intelligent avec enseignant virtuel IA",
-                        'product_name': "Forfait Hebdomadaire (15$/semaine)",
-                        'interval': 'week'
-                    },
-                    'monthly': {
-                        'amount': 5000,  # 50.00 CAD
-                        'description': "Abonnement mensuel - Tutorat intelligent avec enseignant virtuel IA",
-                        'product_name': "Forfait Mensuel (50$/mois)",
-                        'interval': 'month'
-                    },
-                    'annual': {
-                        'amount': 45000,  # 450.00 CAD
-                        'description': "Abonnement annuel - Tutorat intelligent avec enseignant virtuel IA - Économisez 25%",
-                        'product_name': "Forfait Annuel (450$/an) - Meilleur rapport",
-                        'interval': 'year'
-                    }
-                }
-                
-                plan_info = plan_config.get(plan_type, plan_config['annual'])
-                
-                # Traduire les descriptions si nécessaire
+                # 💳 Session de paiement via l'assistant partagé
                 lang = session.get('lang', 'fr')
-                if lang == 'fr':
-                    # Pour le français, ajuster les descriptions
-                    if plan_type == 'weekly':
-                        plan_info['description'] = "Abonnement hebdomadaire - Tutorat intelligent avec enseignant virtuel IA"
-                    elif plan_type == 'monthly':
-                        plan_info['description'] = "Abonnement mensuel - Tutorat intelligent avec enseignant virtuel IA"
-                    elif plan_type == 'annual':
-                        plan_info['description'] = "Abonnement annuel - Tutorat intelligent avec enseignant virtuel IA - Économisez 25%"
-                
-                # Calculer le montant en sous (cents)
-                amount = plan_info['amount']  # Montant en cents
-                print(f"💰 Montant Stripe pour {plan_type}: {amount/100}$ CAD")  # Debug
-                
-                checkout_session = stripe.checkout.Session.create(
-                    payment_method_types=['card'],
-                    line_items=[{
-                        'price_data': {
-                            'currency': 'cad',
-                            'product_data': {
-                                'name': plan_info['product_name'],
-                                'description': plan_info['description'],
-                                'metadata': {
-                                    'plan_type': plan_type,
-                                    'lang': lang
-                                }
-                            },
-                            'unit_amount': amount,
-                            'recurring': {
-                                'interval': plan_info.get('interval', 'year'),
-                                'interval_count': 1
-                            }
-                        },
-                        'quantity': 1,
-                    }],
-                    mode='subscription',
-                    subscription_data={
-                        'metadata': {
-                            'eleve_id': eleve.id,
-                            'plan_type': plan_type,
-                            'lang': lang
-                        }
-                    },
-                    success_url=url_for('paiement_success', _external=True) + f'?session_id={{CHECKOUT_SESSION_ID}}&eleve_id={eleve.id}&plan_type={plan_type}',
-                    cancel_url=url_for('inscription_eleve', _external=True) + f'?cancel=true',
-                    customer_email=form.email.data,
-                    metadata={
-                        'eleve_id': eleve.id,
-                        'plan_type': plan_type,
-                        'lang': lang,
-                        'type': f'abonnement_{plan_type}'
-                    },
-                    allow_promotion_codes=True,
-                    billing_address_collection='required',
-                    phone_number_collection={
-                        'enabled': True
-                    }
+                checkout_session = _creer_session_checkout(
+                    eleve_id=eleve.id,
+                    email=form.email.data,
+                    plan_type=plan_type,
+                    lang=lang,
+                    cancel_url=url_for('inscription_eleve', _external=True) + '?cancel=true',
                 )
-                
+
                 print(f"🔗 Session Stripe créée pour le plan: {plan_type}")  # Debug
                 return redirect(checkout_session.url)
                 
@@ -2983,6 +3716,11 @@ def inscription_eleve():
                 
                 return redirect(url_for('dashboard_eleve'))
                 
+        except IntegrityError:
+            # 🛡️ Violation d'un index unique (email ou nom d'utilisateur déjà pris)
+            db.session.rollback()
+            doublon_message = "Cet email ou ce nom d'utilisateur est déjà utilisé" if session.get('lang', 'fr') == 'fr' else "This email or username is already in use"
+            flash(doublon_message, "error")
         except Exception as e:
             db.session.rollback()
             print(f"❌ Erreur création élève/parent: {e}")
@@ -3005,7 +3743,7 @@ def upgrade_options():
     if "eleve_id" not in session:
         return redirect(url_for("login_eleve"))
     
-    eleve = User.query.get(session["eleve_id"])
+    eleve = get_eleve_courant()
     if not eleve or eleve.role != "élève":
         return redirect(url_for("login_eleve"))
     
@@ -3018,7 +3756,7 @@ def creer_session_paiement():
     if "eleve_id" not in session:
         return jsonify({"error": "Non authentifié"}), 401
     
-    eleve = User.query.get(session["eleve_id"])
+    eleve = get_eleve_courant()
     if not eleve or eleve.role != "élève":
         return jsonify({"error": "Accès non autorisé"}), 403
     
@@ -3027,91 +3765,22 @@ def creer_session_paiement():
         data = request.get_json()
         plan_type = data.get('plan_type', 'annual')  # weekly, monthly, annual
         
-        # NOUVEAUX TARIFS : Configuration des plans
-        plan_config = {
-            'weekly': {
-                'amount': 1500,  # 15.00 CAD
-                'description_fr': "Forfait hebdomadaire - Tutorat intelligent avec enseignant virtuel IA",
-                'description_en': "Weekly plan - Intelligent tutoring with AI virtual teacher",
-                'product_name_fr': "Forfait Hebdomadaire (15$/semaine)",
-                'product_name_en': "Weekly Plan (15$/week)",
-                'interval': 'week'
-            },
-            'monthly': {
-                'amount': 5000,  # 50.00 CAD
-                'description_fr': "Forfait mensuel - Tutorat intelligent avec enseignant virtuel IA",
-                'description_en': "Monthly plan - Intelligent tutoring with AI virtual teacher",
-                'product_name_fr': "Forfait Mensuel (50$/mois)",
-                'product_name_en': "Monthly Plan (50$/month)",
-                'interval': 'month'
-            },
-            'annual': {
-                'amount': 45000,  # 450.00 CAD
-                'description_fr': "Forfait annuel - Tutorat intelligent avec enseignant virtuel IA - Économisez 25%",
-                'description_en': "Annual plan - Intelligent tutoring with AI virtual teacher - Save 25%",
-                'product_name_fr': "Forfait Annuel (450$/an) - Meilleur rapport",
-                'product_name_en': "Annual Plan (450$/year) - Best value",
-                'interval': 'year'
-            }
-        }
-        
-        plan_info = plan_config.get(plan_type, plan_config['annual'])
+        # 💳 Session de paiement via l'assistant partagé
         lang = session.get("lang", "fr")
-        
-        # Sélectionner les textes selon la langue
-        product_name = plan_info[f'product_name_{lang}'] if f'product_name_{lang}' in plan_info else plan_info['product_name_fr']
-        description = plan_info[f'description_{lang}'] if f'description_{lang}' in plan_info else plan_info['description_fr']
-        
-        # Créer une session de paiement Stripe (mode subscription)
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'cad',
-                    'product_data': {
-                        'name': product_name,
-                        'description': description,
-                        'metadata': {
-                            'plan_type': plan_type,
-                            'lang': lang
-                        }
-                    },
-                    'unit_amount': plan_info['amount'],
-                    'recurring': {
-                        'interval': plan_info['interval'],
-                        'interval_count': 1
-                    }
-                },
-                'quantity': 1,
-            }],
-            mode='subscription',
-            subscription_data={
-                'metadata': {
-                    'eleve_id': eleve.id,
-                    'plan_type': plan_type,
-                    'lang': lang
-                }
-            },
-            success_url=url_for('paiement_success', _external=True) + f'?session_id={{CHECKOUT_SESSION_ID}}&eleve_id={eleve.id}&plan_type={plan_type}',
+        checkout_session = _creer_session_checkout(
+            eleve_id=eleve.id,
+            email=eleve.email,
+            plan_type=plan_type,
+            lang=lang,
             cancel_url=url_for('upgrade_options', _external=True) + '?cancel=true',
-            customer_email=eleve.email,
-            metadata={
-                'eleve_id': eleve.id,
-                'plan_type': plan_type,
-                'lang': lang,
-                'type': f'abonnement_{plan_type}'
-            },
-            allow_promotion_codes=True,
-            billing_address_collection='required',
-            phone_number_collection={'enabled': True}
         )
-        
+
         # Retourner l'URL de la session Stripe
         return jsonify({
             "session_id": checkout_session.id,
             "session_url": checkout_session.url,
             "plan_type": plan_type,
-            "amount": plan_info['amount']
+            "amount": PLAN_CONFIG.get(plan_type, PLAN_CONFIG['annual'])['amount']
         })
         
     except Exception as e:
@@ -3125,7 +3794,7 @@ def paiement_direct():
     if "eleve_id" not in session:
         return redirect(url_for("login_eleve"))
     
-    eleve = User.query.get(session["eleve_id"])
+    eleve = get_eleve_courant()
     if not eleve or eleve.role != "élève":
         return redirect(url_for("login_eleve"))
     
@@ -3133,87 +3802,16 @@ def paiement_direct():
     print(f"📋 Paiement direct - Plan demandé: {plan_type}")  # Debug
     
     try:
-        # NOUVEAUX TARIFS : Configuration des plans
-        plan_config = {
-            'weekly': {
-                'amount': 1500,  # 15.00 CAD
-                'description_fr': "Forfait hebdomadaire - Tutorat intelligent avec enseignant virtuel IA",
-                'description_en': "Weekly plan - Intelligent tutoring with AI virtual teacher",
-                'product_name_fr': "Forfait Hebdomadaire (15$/semaine)",
-                'product_name_en': "Weekly Plan (15$/week)",
-                'interval': 'week'
-            },
-            'monthly': {
-                'amount': 5000,  # 50.00 CAD
-                'description_fr': "Forfait mensuel - Tutorat intelligent avec enseignant virtuel IA",
-                'description_en': "Monthly plan - Intelligent tutoring with AI virtual teacher",
-                'product_name_fr': "Forfait Mensuel (50$/mois)",
-                'product_name_en': "Monthly Plan (50$/month)",
-                'interval': 'month'
-            },
-            'annual': {
-                'amount': 45000,  # 450.00 CAD
-                'description_fr': "Forfait annuel - Tutorat intelligent avec enseignant virtuel IA - Économisez 25%",
-                'description_en': "Annual plan - Intelligent tutoring with AI virtual teacher - Save 25%",
-                'product_name_fr': "Forfait Annuel (450$/an) - Meilleur rapport",
-                'product_name_en': "Annual Plan (450$/year) - Best value",
-                'interval': 'year'
-            }
-        }
-        
-        plan_info = plan_config.get(plan_type, plan_config['annual'])
+        # 💳 Session de paiement via l'assistant partagé
         lang = session.get("lang", "fr")
-        
-        # Sélectionner les textes selon la langue
-        product_name = plan_info[f'product_name_{lang}'] if f'product_name_{lang}' in plan_info else plan_info['product_name_fr']
-        description = plan_info[f'description_{lang}'] if f'description_{lang}' in plan_info else plan_info['description_fr']
-        
-        print(f"💰 Paiement direct - Montant pour {plan_type}: {plan_info['amount']/100}$ CAD")  # Debug
-        
-        # Créer une session de paiement Stripe
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'cad',
-                    'product_data': {
-                        'name': product_name,
-                        'description': description,
-                        'metadata': {
-                            'plan_type': plan_type,
-                            'lang': lang
-                        }
-                    },
-                    'unit_amount': plan_info['amount'],
-                    'recurring': {
-                        'interval': plan_info['interval'],
-                        'interval_count': 1
-                    }
-                },
-                'quantity': 1,
-            }],
-            mode='subscription',
-            subscription_data={
-                'metadata': {
-                    'eleve_id': eleve.id,
-                    'plan_type': plan_type,
-                    'lang': lang
-                }
-            },
-            success_url=url_for('paiement_success', _external=True) + f'?session_id={{CHECKOUT_SESSION_ID}}&eleve_id={eleve.id}&plan_type={plan_type}',
+        checkout_session = _creer_session_checkout(
+            eleve_id=eleve.id,
+            email=eleve.email,
+            plan_type=plan_type,
+            lang=lang,
             cancel_url=url_for('upgrade_options', _external=True) + '?cancel=true',
-            customer_email=eleve.email,
-            metadata={
-                'eleve_id': eleve.id,
-                'plan_type': plan_type,
-                'lang': lang,
-                'type': f'abonnement_{plan_type}'
-            },
-            allow_promotion_codes=True,
-            billing_address_collection='required',
-            phone_number_collection={'enabled': True}
         )
-        
+
         # Redirection directe vers Stripe
         return redirect(checkout_session.url)
         
@@ -3237,7 +3835,24 @@ def paiement_success():
         if not session_id or not eleve_id:
             flash("Paramètres de paiement manquants", "error")
             return redirect(url_for('inscription_eleve'))
-        
+
+        # ⚡ Si cette session Stripe a déjà été validée (rafraîchissement de la
+        # page de succès), inutile de re-bloquer le worker sur stripe.com :
+        # le compte est déjà activé, on reconnecte directement l'élève.
+        from models import User
+        # ⚡ Seules cinq colonnes servent ici : load_only évite d'hydrater le
+        # hash de mot de passe et les champs d'essai du compte
+        eleve_deja_paye = User.query.options(load_only(
+            User.id, User.username, User.nom_complet,
+            User.stripe_session_id, User.statut_paiement,
+        )).get(eleve_id)
+        if eleve_deja_paye and eleve_deja_paye.stripe_session_id == session_id \
+                and eleve_deja_paye.statut_paiement == "paye":
+            session['eleve_id'] = eleve_deja_paye.id
+            session['eleve_username'] = eleve_deja_paye.username
+            session['eleve_nom_complet'] = eleve_deja_paye.nom_complet
+            return redirect(url_for('dashboard_eleve'))
+
         # Vérifier la session Stripe
         stripe_session = stripe.checkout.Session.retrieve(session_id)
         
@@ -3262,7 +3877,6 @@ def paiement_success():
                 )
                 
                 # ⬇️ AJOUTER LA DATE DE FIN D'ABONNEMENT
-                from datetime import datetime, timedelta
                 eleve.date_fin_abonnement = datetime.utcnow() + timedelta(days=duration_days)
                 
                 db.session.commit()
@@ -3319,7 +3933,10 @@ def paiement_cancel():
         
         if eleve_id:
             from models import User, db
-            eleve = User.query.get(eleve_id)
+            # ⚡ Seul le statut de paiement est consulté sur ce chemin
+            eleve = User.query.options(
+                load_only(User.id, User.statut_paiement)
+            ).get(eleve_id)
             if eleve:
                 # Ne pas supprimer l'élève, mais laisser l'essai gratuit actif
                 if eleve.statut_paiement == "essai_gratuit":
@@ -3351,7 +3968,6 @@ def paiement_cancel():
 def admin_inscrire_eleve():
     from forms import InscriptionEleveAdminForm  # ✅ Formulaire AVEC parent
     from models import Niveau, Enseignant, User, db, Parent, ParentEleve
-    from datetime import datetime
     
     form = InscriptionEleveAdminForm()
     
@@ -3479,8 +4095,13 @@ def modifier_profil_enseignant():
         if not nom or not email:
             return "Champs obligatoires manquants", 400
 
-        existant = Enseignant.query.filter_by(email=email).first()
-        if existant and existant.id != enseignant.id:
+        # 🔎 EXISTS scalaire : seul un booléen revient du serveur
+        email_pris = db.session.query(
+            Enseignant.query.filter(
+                Enseignant.email == email, Enseignant.id != enseignant.id
+            ).exists()
+        ).scalar()
+        if email_pris:
             return "Cet email est déjà utilisé", 409
 
         enseignant.nom = nom
@@ -3550,14 +4171,31 @@ def remediations_en_attente():
     if "enseignant_id" not in session:
         return redirect("/login-enseignant")
 
+    # Chargement anticipé de l'élève : le template affiche s.user.nom_complet
     suggestions = RemediationSuggestion.query \
         .join(User, User.id == RemediationSuggestion.user_id) \
+        .options(joinedload(RemediationSuggestion.user)) \
         .filter(RemediationSuggestion.statut == "en_attente") \
         .filter(User.enseignant_id == session["enseignant_id"]) \
         .all()
 
     return render_template("remediations_en_attente.html", suggestions=suggestions)
 
+# 🔎 Patrons précompilés d'extraction des champs d'un exercice suggéré
+_CHAMPS_SUGGESTION = {
+    "fr": (
+        re.compile(r"Question\s*[:：]\s*(.*)"),
+        re.compile(r"Réponse attendue\s*[:：]\s*(.*)"),
+        re.compile(r"Explication\s*[:：]\s*(.*)"),
+    ),
+    "en": (
+        re.compile(r"Question\s*[:：]\s*(.*)"),
+        re.compile(r"Expected answer\s*[:：]\s*(.*)"),
+        re.compile(r"Explanation\s*[:：]\s*(.*)"),
+    ),
+}
+
+
 @app.route("/enseignant/valider-remediation/<int:remediation_id>", methods=["GET", "POST"])
 def valider_remediation(remediation_id):
     if "enseignant_id" not in session:
@@ -3588,18 +4226,15 @@ def valider_remediation(remediation_id):
         return redirect(url_for("remediations_a_valider", lang=lang))
 
     # 🧠 Pré-remplir les champs si possible
-    import re
 
     exercice_suggere = suggestion.exercice_suggere or ""
 
-    if lang == "en":
-        question_match = re.search(r"Question\s*[:：]\s*(.*)", exercice_suggere)
-        reponse_match = re.search(r"Expected answer\s*[:：]\s*(.*)", exercice_suggere)
-        explication_match = re.search(r"Explanation\s*[:：]\s*(.*)", exercice_suggere)
-    else:
-        question_match = re.search(r"Question\s*[:：]\s*(.*)", exercice_suggere)
-        reponse_match = re.search(r"Réponse attendue\s*[:：]\s*(.*)", exercice_suggere)
-        explication_match = re.search(r"Explication\s*[:：]\s*(.*)", exercice_suggere)
+    patron_question, patron_reponse, patron_explication = _CHAMPS_SUGGESTION[
+        "en" if lang == "en" else "fr"
+    ]
+    question_match = patron_question.search(exercice_suggere)
+    reponse_match = patron_reponse.search(exercice_suggere)
+    explication_match = patron_explication.search(exercice_suggere)
 
     question_text = question_match.group(1).strip() if question_match else ""
     reponse_text = reponse_match.group(1).strip() if reponse_match else ""
@@ -3681,7 +4316,7 @@ def login_enseignant():
     if request.method == "POST":
         email = request.form.get("email")
         mot_de_passe = request.form.get("mot_de_passe")
-        enseignant = Enseignant.query.filter_by(email=email).first()
+        enseignant = chercher_enseignant_par_email(email)
 
         if enseignant and enseignant.verifier_mot_de_passe(mot_de_passe):
             session["enseignant_id"] = enseignant.id
@@ -3796,7 +4431,6 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import inch
 from io import BytesIO
-from datetime import datetime
 
 def get_pdf_texts(lang):
     """Retourne les textes dans la langue appropriée"""
@@ -4209,7 +4843,6 @@ def choisir_sequence():
     )
 
 
-from datetime import datetime, timedelta
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -4224,7 +4857,7 @@ def dashboard_eleve():
     if "eleve_id" not in session:
         return redirect(url_for("login_eleve"))
 
-    eleve = User.query.options(joinedload(User.niveau)).get(session["eleve_id"])
+    eleve = get_eleve_courant()
     if not eleve or eleve.role != "élève":
         return "Accès non autorisé", 403
 
@@ -4421,7 +5054,6 @@ def reset_admin_password():
     try:
         with app.app_context():
             from werkzeug.security import generate_password_hash, check_password_hash
-            from datetime import datetime
             
             email = "ambroiseguehi@gmail.com"
             password = "Ninsem@n@912"
@@ -4471,7 +5103,8 @@ def create_profile():
     if not all([nom_complet, niveau, email, parent_nom, parent_email]):
         return jsonify({"error": "Tous les champs sont obligatoires."}), 400
 
-    if User.query.filter_by(email=email).first():
+    # 🔎 EXISTS scalaire : seul un booléen revient du serveur
+    if db.session.query(User.query.filter_by(email=email).exists()).scalar():
         return jsonify({"error": "Cette adresse e-mail est déjà utilisée."}), 409
 
     parent = Parent.query.filter_by(email=parent_email).first()
@@ -4483,7 +5116,7 @@ def create_profile():
     i = 1
     while True:
         username = f"student_{i:03d}"
-        if not User.query.filter_by(username=username).first():
+        if not db.session.query(User.query.filter_by(username=username).exists()).scalar():
             break
         i += 1
 
@@ -4606,7 +5239,6 @@ def retour_exercices():
 
 @app.route("/test/<int:test_id>", methods=["GET", "POST"])
 def faire_test_sommatif(test_id):
-    from datetime import datetime
 
     username = request.args.get("username")
     lang = request.args.get("lang", "fr")
@@ -4743,38 +5375,34 @@ Correction :
 
         etoiles_total = 0
         exercices_corriges = 0
-        
+        lignes_reponses = []  # ⚡ lignes à insérer en un seul executemany
+
         for ex_id, reponse_texte, bloc in zip(ids_exercices, reponses_elevees, blocs):
             test_ex = TestExercice.query.get(int(ex_id))
             if not test_ex:
                 continue
 
             texte = bloc.strip()
-            etoiles = 0
-            
+
             # ✅ EXTRACTION DE NOTE SUR 5
-            match = re.search(r"(Note|Score)\s*:\s*(\d)/5", texte, re.IGNORECASE)
-            if match:
-                etoiles = int(match.group(2))
-            else:
-                # Fallback pour l'ancien format
-                match = re.search(r"(Note|Score)\s*:\s*(\d)", texte, re.IGNORECASE)
-                if match:
-                    etoiles = min(int(match.group(2)), 5)  # Limite à 5 maximum
+            etoiles = _extraire_note(texte) or 0
 
             etoiles_total += etoiles
             exercices_corriges += 1
 
-            nouvelle = StudentResponse(
-                user_id=eleve.id,
-                test_id=test.id,
-                test_exercice_id=test_ex.id,
-                reponse_eleve=reponse_texte.strip(),
-                analyse_ia=texte,
-                etoiles=etoiles,
-                timestamp=datetime.utcnow()
-            )
-            db.session.add(nouvelle)
+            lignes_reponses.append({
+                "user_id": eleve.id,
+                "test_id": test.id,
+                "test_exercice_id": test_ex.id,
+                "reponse_eleve": reponse_texte.strip(),
+                "analyse_ia": texte,
+                "etoiles": etoiles,
+                "timestamp": datetime.utcnow(),
+            })
+
+        # ⚡ Un seul INSERT (executemany) au lieu d'un aller-retour BD par exercice
+        if lignes_reponses:
+            db.session.execute(insert(StudentResponse), lignes_reponses)
 
         # Calcul de la moyenne sur 5
         moyenne = round(etoiles_total / max(exercices_corriges, 1), 1) if exercices_corriges > 0 else 0
@@ -4827,10 +5455,13 @@ Correction :
 
 @app.route("/remediations/export-pdf")
 def export_remediations_pdf():
-    suggestions = RemediationSuggestion.query.all()
+    # Chargement anticipé : évite une requête User + Niveau par suggestion
+    suggestions = RemediationSuggestion.query.options(
+        joinedload(RemediationSuggestion.user).joinedload(User.niveau)
+    ).all()
     donnees = []
     for s in suggestions:
-        eleve = User.query.get(s.user_id)
+        eleve = s.user
         donnees.append({
             "eleve_nom": eleve.nom_complet,
             "niveau": eleve.niveau.nom if eleve.niveau else "Non défini",
@@ -4843,11 +5474,19 @@ def export_remediations_pdf():
 
     rendered = render_template("enseignant_remediations.html", suggestions=donnees)
 
-    try:
-        config = pdfkit.configuration(wkhtmltopdf=r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe")  # Windows
-        pdf = pdfkit.from_string(rendered, False, configuration=config)
-    except Exception as e:
-        return f"Erreur PDF : {str(e)}", 500
+    # ⚡ wkhtmltopdf est un sous-processus lourd (plusieurs secondes) : on met le
+    # PDF en cache par empreinte du HTML rendu. Tant que les suggestions ne
+    # changent pas, les exports suivants ressortent du cache sans relancer la
+    # conversion.
+    cle_pdf = "pdf:remediations:" + hashlib.blake2b(rendered.encode("utf-8")).hexdigest()
+    pdf = cache.get(cle_pdf)
+    if pdf is None:
+        try:
+            config = pdfkit.configuration(wkhtmltopdf=r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe")  # Windows
+            pdf = pdfkit.from_string(rendered, False, configuration=config)
+        except Exception as e:
+            return f"Erreur PDF : {str(e)}", 500
+        cache.set(cle_pdf, pdf, timeout=3600)
 
     response = make_response(pdf)
     response.headers["Content-Type"] = "application/pdf"
@@ -4869,8 +5508,6 @@ def supprimer_remediation(id):
 
 @app.route("/soumettre-sequentiel", methods=["POST"])
 def soumettre_sequentiel():
-    from datetime import datetime, timezone
-    import re
 
     print("=== 📝 SOUMISSION SÉQUENTIELLE ===")
     
@@ -4973,19 +5610,12 @@ Correction :
             print(f"❌ Erreur lors de l'appel IA: {e}")
 
         # Extraction de la note sur 5
-        etoiles = 0
-        match = re.search(r"(Note|Score)\s*:\s*(\d)/5", analyse_ia, re.IGNORECASE)
-        if match:
-            etoiles = int(match.group(2))
-            print(f"⭐ Note extraite: {etoiles}/5")
+        note = _extraire_note(analyse_ia)
+        if note is not None:
+            print(f"⭐ Note extraite: {note}/5")
         else:
-            # Fallback si le format /5 n'est pas respecté
-            match = re.search(r"(Note|Score)\s*:\s*(\d)", analyse_ia, re.IGNORECASE)
-            if match:
-                etoiles = min(int(match.group(2)), 5)  # Limite à 5 maximum
-                print(f"⭐ Note extraite (sans /5): {etoiles}/5")
-            else:
-                print("⚠️ Impossible d'extraire la note de l'analyse IA")
+            print("⚠️ Impossible d'extraire la note de l'analyse IA")
+        etoiles = note or 0
 
         # Sauvegarde réponse
         try:
@@ -5081,9 +5711,9 @@ Indice : ...
 
         print("=== ✅ RÉPONSE SÉQUENTIELLE SAUVEGARDÉE ===")
 
-    # Récupérer tous les exercices pour déterminer s'il y a un suivant
-    exercices = Exercice.query.filter_by(lecon_id=lecon_id).all()
-    total_exercices = len(exercices)
+    # Récupérer le nombre d'exercices pour déterminer s'il y a un suivant
+    # ⚡ Seul le total compte ici : on ne rapatrie pas les énoncés complets
+    total_exercices = Exercice.query.filter_by(lecon_id=lecon_id).count()
     next_index = index + 1
     has_next = next_index < total_exercices
 
@@ -5114,7 +5744,6 @@ Indice : ...
         current_reponse=reponse_eleve
     )
 
-from datetime import datetime, timezone
 
 @app.route("/faire-exercice-sequentiel")
 def faire_exercice_sequentiel():
@@ -5155,11 +5784,8 @@ def faire_exercice_sequentiel():
     )
 
 
-import re
-
 @app.route("/soumettre-remediation/<int:remediation_id>", methods=["POST"])
 def soumettre_remediation(remediation_id):
-    from datetime import datetime
     reponse_eleve = request.form.get("reponse_eleve") or request.form.get("reponse", "").strip()
 
     remediation = RemediationSuggestion.query.get_or_404(remediation_id)
@@ -5239,19 +5865,12 @@ Correction :
         return f"Erreur IA : {e}", 500
 
     # ✅ EXTRACTION DE NOTE SUR 5
-    etoiles = 0
-    match = re.search(r"(Note|Score)\s*:\s*(\d)/5", analyse_ia, re.IGNORECASE)
-    if match:
-        etoiles = int(match.group(2))
-        print(f"⭐ Note remédiation extraite: {etoiles}/5")
+    note = _extraire_note(analyse_ia)
+    if note is not None:
+        print(f"⭐ Note remédiation extraite: {note}/5")
     else:
-        # Fallback si le format /5 n'est pas respecté
-        match = re.search(r"(Note|Score)\s*:\s*(\d)", analyse_ia, re.IGNORECASE)
-        if match:
-            etoiles = min(int(match.group(2)), 5)  # Limite à 5 maximum
-            print(f"⭐ Note remédiation extraite (sans /5): {etoiles}/5")
-        else:
-            print("⚠️ Impossible d'extraire la note de l'analyse IA")
+        print("⚠️ Impossible d'extraire la note de l'analyse IA")
+    etoiles = note or 0
 
     # ✅ Mise à jour du statut de la remédiation
     if etoiles >= 3:  # Si note ≥ 3/5, la remédiation est réussie
@@ -5289,8 +5908,10 @@ def nouvelles_remediations():
     if not session.get("enseignant_id"):
         return redirect("/login-enseignant")
 
+    # Chargement anticipé de l'élève : le template affiche s.user.nom_complet
     suggestions = RemediationSuggestion.query \
         .join(User, RemediationSuggestion.user_id == User.id) \
+        .options(joinedload(RemediationSuggestion.user)) \
         .filter(User.enseignant_id == session["enseignant_id"]) \
         .filter(RemediationSuggestion.notif_envoyee == False) \
         .all()
@@ -5486,10 +6107,13 @@ def historique_eleve():
 
 @app.route("/enseignant-remediations")
 def enseignant_remediations():
-    suggestions = RemediationSuggestion.query.all()
+    # Chargement anticipé : évite une requête User + Niveau par suggestion
+    suggestions = RemediationSuggestion.query.options(
+        joinedload(RemediationSuggestion.user).joinedload(User.niveau)
+    ).all()
     donnees = []
     for s in suggestions:
-        eleve = User.query.get(s.user_id)
+        eleve = s.user
         donnees.append({
             "eleve_nom": eleve.nom_complet,
             "niveau": eleve.niveau,
@@ -5521,7 +6145,8 @@ def admin_creer_eleve():
         if not all([nom_complet, email, niveau_id, enseignant_id]):
             return "Tous les champs sont obligatoires", 400
 
-        if User.query.filter_by(email=email).first():
+        # 🔎 EXISTS scalaire : seul un booléen revient du serveur
+        if db.session.query(User.query.filter_by(email=email).exists()).scalar():
             return "Un élève avec cet email existe déjà", 409
 
         if not mot_de_passe_clair:
@@ -5531,7 +6156,7 @@ def admin_creer_eleve():
         i = 1
         while True:
             username = f"student_{i:03d}"
-            if not User.query.filter_by(username=username).first():
+            if not db.session.query(User.query.filter_by(username=username).exists()).scalar():
                 break
             i += 1
 
@@ -5853,31 +6478,19 @@ def visualiser_exercices_lecon(lecon_id):
 def api_matieres():
     niveau_id = request.args.get("niveau_id")
     lang = request.args.get("lang", "fr")
-    matieres = Matiere.query.filter_by(niveau_id=niveau_id).all()
-    return jsonify([
-        {"id": m.id, "nom": m.nom_en if lang == "en" and m.nom_en else m.nom}
-        for m in matieres
-    ])
+    return jsonify(get_matieres_par_niveau(niveau_id, lang))
 
 @app.route("/api/unites")
 def api_unites():
     matiere_id = request.args.get("matiere_id")
     lang = request.args.get("lang", "fr")
-    unites = Unite.query.filter_by(matiere_id=matiere_id).all()
-    return jsonify([
-        {"id": u.id, "nom": u.nom_en if lang == "en" and u.nom_en else u.nom}
-        for u in unites
-    ])
+    return jsonify(get_unites_par_matiere(matiere_id, lang))
 
 @app.route("/api/lecons")
 def api_lecons():
     unite_id = request.args.get("unite_id")
     lang = request.args.get("lang", "fr")
-    lecons = Lecon.query.filter_by(unite_id=unite_id).all()
-    return jsonify([
-        {"id": l.id, "titre": l.titre_en if lang == "en" and l.titre_en else l.titre_fr}
-        for l in lecons
-    ])
+    return jsonify(get_lecons_par_unite(unite_id, lang))
 
 from models import TestExercice
 @app.route("/admin/ajouter-test", methods=["GET", "POST"])
@@ -6075,7 +6688,7 @@ def login_eleve():
     if request.method == 'POST':
         email = request.form.get("email")
         mot_de_passe = request.form.get("mot_de_passe")
-        eleve = User.query.filter_by(email=email, role="élève").first()
+        eleve = chercher_eleve_par_email(email)
 
         if eleve and eleve.verifier_mot_de_passe(mot_de_passe):
             # Vérifier si l'essai est expiré
@@ -6123,7 +6736,7 @@ def before_request():
     if 'eleve_id' in session and request.endpoint and any(route in request.endpoint for route in ['dashboard_eleve', 'contenus_eleve', 'exercice', 'enseignant_virtuel']):
         from models import User
         
-        eleve = User.query.get(session['eleve_id'])
+        eleve = get_eleve_courant()
         if eleve and eleve.role == "élève":
             # VÉRIFICATION ESSAI GRATUIT EXPIRÉ
             if eleve.essai_est_expire() and eleve.statut_paiement != "paye":
@@ -6235,4 +6848,6 @@ def liste_exercice():
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    # threaded=True : permet de servir plusieurs requêtes pendant les attentes
+    # OpenAI/Stripe en développement (la prod utilise gunicorn, voir gunicorn.conf.py)
+    app.run(debug=True, threaded=True)
@@ -1,4 +1,5 @@
 import nltk
+from functools import lru_cache
 from nltk.chat.util import Chat, reflections
 
 # Télécharger les données nécessaires une seule fois (au besoin)
@@ -32,13 +33,24 @@ pairs = [
     ]
 ]
 
+# 🤖 Le bot est construit une seule fois au chargement du module :
+# recompiler les regex des paires à chaque message est inutile.
+_bot = Chat(pairs, reflections)
+
 def chatbot():
-    return Chat(pairs, reflections)
+    return _bot
 
-def get_chatbot_response(user_input):
-    bot = chatbot()
-    response = bot.respond(user_input)
+@lru_cache(maxsize=512)
+def _reponse_memorisee(signature):
+    """Calcule la réponse du bot pour un message normalisé (mémorisée)."""
+    response = _bot.respond(signature)
     if response:
         return response
     else:
         return "Je ne suis pas sûr de comprendre. Peux-tu reformuler ou préciser le concept mathématique ?"
+
+def get_chatbot_response(user_input):
+    # ⚡ Deux élèves qui posent la même question (aux espaces/majuscules près)
+    # obtiennent la réponse depuis le cache, sans repasser par le moteur.
+    signature = " ".join(user_input.split()).lower()
+    return _reponse_memorisee(signature)
@@ -0,0 +1,30 @@
+# gunicorn.conf.py
+# Configuration du serveur pour la production (Render)
+import multiprocessing
+import os
+
+# 🚀 Les handlers passent l'essentiel de leur temps à attendre OpenAI/Stripe :
+# des workers threadés ("gthread") continuent de servir d'autres requêtes
+# pendant ces attentes réseau, au lieu de bloquer un worker entier.
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+# 🛡️ Sans Redis, l'état des tâches de fond vit dans un SimpleCache par
+# processus : avec plusieurs workers, le sondage de /admin/tache-status
+# tomberait sur un autre processus et verrait des tâches "inconnues".
+# On force alors un seul worker plutôt que de casser le flux aléatoirement.
+if not os.getenv("REDIS_URL") and workers > 1:
+    import warnings
+    warnings.warn(
+        "REDIS_URL absent : repli sur 1 worker gunicorn pour garder "
+        "l'état des tâches de fond cohérent (SimpleCache par processus)."
+    )
+    workers = 1
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+
+# Les appels GPT-4 peuvent être longs : timeout généreux
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+keepalive = 5
+
+# Render fournit le port via $PORT (10000 par défaut en local)
+bind = "0.0.0.0:" + os.getenv("PORT", "10000")
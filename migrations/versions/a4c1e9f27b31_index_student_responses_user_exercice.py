@@ -0,0 +1,29 @@
+"""Index couvrant (user_id, exercice_id) sur student_responses
+
+Revision ID: a4c1e9f27b31
+Revises: 3910e5ed12a5
+Create Date: 2026-08-26 10:12:04.331208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c1e9f27b31'
+down_revision = '3910e5ed12a5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_student_responses_user_exercice',
+        'student_responses',
+        ['user_id', 'exercice_id'],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_student_responses_user_exercice', table_name='student_responses')
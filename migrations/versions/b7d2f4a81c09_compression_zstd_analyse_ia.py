@@ -0,0 +1,84 @@
+"""Compression zstd de analyse_ia et exercice_suggere
+
+Revision ID: b7d2f4a81c09
+Revises: a4c1e9f27b31
+Create Date: 2026-08-26 10:41:37.554912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import zstandard
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2f4a81c09'
+down_revision = 'a4c1e9f27b31'
+branch_labels = None
+depends_on = None
+
+# Magic number zstd : permet de reconnaître les lignes déjà compressées
+_MAGIC_ZSTD = b'\x28\xb5\x2f\xfd'
+
+_COLONNES = (
+    ('student_responses', 'analyse_ia'),
+    ('remediation_suggestion', 'exercice_suggere'),
+)
+
+
+def _table(nom_table, nom_colonne):
+    return sa.table(
+        nom_table,
+        sa.column('id', sa.Integer),
+        sa.column(nom_colonne, sa.LargeBinary),
+    )
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for nom_table, nom_colonne in _COLONNES:
+            op.alter_column(
+                nom_table, nom_colonne,
+                type_=sa.LargeBinary(),
+                postgresql_using=f"convert_to({nom_colonne}, 'UTF8')",
+            )
+
+    compresseur = zstandard.ZstdCompressor()
+    for nom_table, nom_colonne in _COLONNES:
+        t = _table(nom_table, nom_colonne)
+        colonne = t.c[nom_colonne]
+        for id_, valeur in bind.execute(sa.select(t.c.id, colonne)).fetchall():
+            if valeur is None:
+                continue
+            octets = valeur.encode('utf-8') if isinstance(valeur, str) else bytes(valeur)
+            if octets[:4] == _MAGIC_ZSTD:
+                continue
+            bind.execute(
+                t.update().where(t.c.id == id_)
+                .values(**{nom_colonne: compresseur.compress(octets)})
+            )
+
+
+def downgrade():
+    bind = op.get_bind()
+    decompresseur = zstandard.ZstdDecompressor()
+    for nom_table, nom_colonne in _COLONNES:
+        t = _table(nom_table, nom_colonne)
+        colonne = t.c[nom_colonne]
+        for id_, valeur in bind.execute(sa.select(t.c.id, colonne)).fetchall():
+            if valeur is None:
+                continue
+            octets = valeur.encode('utf-8') if isinstance(valeur, str) else bytes(valeur)
+            if octets[:4] == _MAGIC_ZSTD:
+                bind.execute(
+                    t.update().where(t.c.id == id_)
+                    .values(**{nom_colonne: decompresseur.decompress(octets)})
+                )
+
+    if bind.dialect.name == 'postgresql':
+        for nom_table, nom_colonne in _COLONNES:
+            op.alter_column(
+                nom_table, nom_colonne,
+                type_=sa.Text(),
+                postgresql_using=f"convert_from({nom_colonne}, 'UTF8')",
+            )
@@ -0,0 +1,47 @@
+"""Index uniques sur users.email, users.username et parents.email
+
+Revision ID: c3f8a61d507e
+Revises: b7d2f4a81c09
+Create Date: 2026-08-26 11:27:18.904466
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f8a61d507e'
+down_revision = 'b7d2f4a81c09'
+branch_labels = None
+depends_on = None
+
+_INDEX = (
+    ('ix_users_email', 'users', 'email'),
+    ('ix_users_username', 'users', 'username'),
+    ('ix_parents_email', 'parents', 'email'),
+)
+
+
+def _colonne_deja_unique(inspecteur, nom_table, nom_colonne):
+    """Les bases créées via create_all() portent déjà la contrainte unique."""
+    for index in inspecteur.get_indexes(nom_table):
+        if index.get('unique') and index.get('column_names') == [nom_colonne]:
+            return True
+    for contrainte in inspecteur.get_unique_constraints(nom_table):
+        if contrainte.get('column_names') == [nom_colonne]:
+            return True
+    return False
+
+
+def upgrade():
+    inspecteur = sa.inspect(op.get_bind())
+    for nom_index, nom_table, nom_colonne in _INDEX:
+        if not _colonne_deja_unique(inspecteur, nom_table, nom_colonne):
+            op.create_index(nom_index, nom_table, [nom_colonne], unique=True)
+
+
+def downgrade():
+    inspecteur = sa.inspect(op.get_bind())
+    for nom_index, nom_table, nom_colonne in _INDEX:
+        if any(i['name'] == nom_index for i in inspecteur.get_indexes(nom_table)):
+            op.drop_index(nom_index, table_name=nom_table)
@@ -1,9 +1,80 @@
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.types import TypeDecorator
+from argon2 import PasswordHasher
+from argon2.exceptions import VerifyMismatchError, InvalidHashError
+import zstandard
 
 db = SQLAlchemy()
 
+
+class TexteZstd(TypeDecorator):
+    """Texte compressé en zstd côté application, transparent pour l'ORM.
+
+    Les sorties GPT multi-kilo-octets (analyses, remédiations) pèsent 3-5×
+    moins en base ; les anciennes lignes non compressées restent lisibles.
+    """
+    impl = db.LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return zstandard.ZstdCompressor().compress(value.encode("utf-8"))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return value  # ligne héritée non migrée (SQLite de développement)
+        try:
+            return zstandard.ZstdDecompressor().decompress(value).decode("utf-8")
+        except zstandard.ZstdError:
+            # Ligne héritée stockée en octets bruts, avant compression
+            return bytes(value).decode("utf-8", errors="replace")
+
+# 🛡️ Argon2id : plus sûr et moins coûteux en CPU que PBKDF2 à force équivalente
+# (réglé pour ~50 ms par vérification, au lieu de centaines de milliers
+# d'itérations SHA-256 côté Werkzeug)
+_hasheur = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+
+def _hacher_mot_de_passe(mot):
+    return _hasheur.hash(mot)
+
+
+def _verifier_hash(hash_stocke, mot_saisi):
+    """Vérifie un hash Argon2 ou, pour les anciens comptes, Werkzeug.
+
+    Retourne (valide, ancien_format) : ancien_format indique qu'une
+    migration paresseuse vers Argon2 est souhaitable.
+    """
+    if not hash_stocke:
+        return False, False
+    if hash_stocke.startswith("$argon2"):
+        try:
+            _hasheur.verify(hash_stocke, mot_saisi)
+            return True, False
+        except (VerifyMismatchError, InvalidHashError):
+            return False, False
+    # Ancien hash Werkzeug (pbkdf2/scrypt)
+    return check_password_hash(hash_stocke, mot_saisi), True
+
+
+def _persister_rehachage():
+    """Commit immédiat du re-hachage paresseux.
+
+    Sans commit, le hash Argon2 est jeté au teardown de la requête et la
+    coûteuse vérification Werkzeug se répète à chaque connexion. Les routes
+    de connexion n'ont rien d'autre en attente dans la session à ce stade.
+    """
+    try:
+        db.session.commit()
+    except Exception:
+        # Le re-hachage est opportuniste : un échec ne doit pas bloquer la connexion
+        db.session.rollback()
+
 class User(db.Model):
     __tablename__ = "users"
 
@@ -33,7 +104,15 @@ class User(db.Model):
     langue = db.Column(db.String(10), default="fr")
 
     # 👨‍👩‍👧 Relation avec les parents
-    parents = db.relationship("Parent", secondary="parent_eleve", backref="enfants")
+    # viewonly : la table parent_eleve est aussi mappée (ParentEleve) et les
+    # écritures passent par elle ; sans viewonly SQLAlchemy émet un SAWarning
+    # de colonnes en conflit entre les deux chemins.
+    parents = db.relationship(
+        "Parent",
+        secondary="parent_eleve",
+        backref=db.backref("enfants", viewonly=True),
+        viewonly=True,
+    )
 
     # 🆕 CHAMPS POUR LE SYSTÈME DE PAIEMENT ET INSCRIPTION
     statut = db.Column(db.String(20), default="actif")
@@ -90,11 +169,16 @@ class User(db.Model):
 
     @mot_de_passe.setter
     def mot_de_passe(self, mot):
-        self.mot_de_passe_hash = generate_password_hash(mot)
+        self.mot_de_passe_hash = _hacher_mot_de_passe(mot)
 
     def verifier_mot_de_passe(self, mot_saisi):
-        return check_password_hash(self.mot_de_passe_hash, mot_saisi)
-    
+        valide, ancien_format = _verifier_hash(self.mot_de_passe_hash, mot_saisi)
+        if valide and ancien_format:
+            # Migration paresseuse : re-hachage en Argon2 à la connexion réussie
+            self.mot_de_passe_hash = _hacher_mot_de_passe(mot_saisi)
+            _persister_rehachage()
+        return valide
+
     # 🆕 MÉTHODES POUR LA GESTION DES PAIEMENTS ET ESSAI
     def marquer_comme_paye(self, stripe_session_id=None, stripe_payment_intent=None):
         """Marquer l'utilisateur comme payé"""
@@ -263,7 +347,7 @@ class RemediationSuggestion(db.Model):
 
     # 🧠 Message et remédiation
     message = db.Column(db.Text, nullable=True)           # Analyse des erreurs ou difficultés
-    exercice_suggere = db.Column(db.Text, nullable=True)  # Ex : "Complète la phrase suivante..."
+    exercice_suggere = db.Column(TexteZstd, nullable=True)  # Ex : "Complète la phrase suivante..."
 
     # 🕓 Suivi et statut
     statut = db.Column(db.String(20), default="en_attente")  # "en_attente", "valide", "refuse"
@@ -296,10 +380,15 @@ class Enseignant(db.Model):
 
     @mot_de_passe.setter
     def mot_de_passe(self, mot):
-        self.mot_de_passe_hash = generate_password_hash(mot)
+        self.mot_de_passe_hash = _hacher_mot_de_passe(mot)
 
     def verifier_mot_de_passe(self, mot_saisi):
-        return check_password_hash(self.mot_de_passe_hash, mot_saisi)
+        valide, ancien_format = _verifier_hash(self.mot_de_passe_hash, mot_saisi)
+        if valide and ancien_format:
+            # Migration paresseuse : re-hachage en Argon2 à la connexion réussie
+            self.mot_de_passe_hash = _hacher_mot_de_passe(mot_saisi)
+            _persister_rehachage()
+        return valide
 
 
 class Parent(db.Model):
@@ -490,6 +579,11 @@ class TestSommatif(db.Model):
 
 class StudentResponse(db.Model):
     __tablename__ = "student_responses"
+    # 🔎 Index couvrant : la recherche « cet élève a-t-il déjà fait cet
+    # exercice ? » (faire_exercice) devient une lecture d'index directe
+    __table_args__ = (
+        db.Index("ix_student_responses_user_exercice", "user_id", "exercice_id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     exercice_id = db.Column(db.Integer, db.ForeignKey('exercices.id'), nullable=True)
@@ -497,7 +591,7 @@ class StudentResponse(db.Model):
     test_id = db.Column(db.Integer, db.ForeignKey('tests_sommatifs.id'), nullable=True)
 
     reponse_eleve = db.Column(db.Text)
-    analyse_ia = db.Column(db.Text)
+    analyse_ia = db.Column(TexteZstd)
     etoiles = db.Column(db.Integer)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 